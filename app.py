@@ -1,65 +1,17 @@
-import io
-import os
-import base64
-import cv2
-import numpy as np
-from PIL import Image
 from flask import Flask, request, jsonify, render_template, send_from_directory
 from flask_cors import CORS
 
-from utils.orthanc_client import upload_dicom, get_orthanc_preview
-from modules.bone_detection import BoneDetector
-from modules.brain_detection import BrainTumorDetector
-from modules.skin_detection import SkinDetector
-from modules.ecg_detection import ECGDetector
+from pipeline import (
+    registry, AnalysisError, ecg_options, analysis_options, load_image,
+    analyze_ecg, base_result, run_analysis, encode_artifacts, model_action,
+    store_result, query_results, result_store,
+    ecg_streams, create_ecg_stream, push_ecg_stream, triage_stats,
+    parse_types, run_fanout, fanout_response
+)
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 CORS(app)
 
-print("--- Initializing AI Modules ---")
-bone_engine = BoneDetector()
-brain_engine = BrainTumorDetector()
-skin_engine = SkinDetector()
-ecg_engine = ECGDetector()
-print("--- Initialization Complete ---")
-
-def img_to_b64(img_obj):
-    try:
-        if img_obj is None: return None
-        if img_obj.mode != 'RGB': img_obj = img_obj.convert('RGB')
-        buf = io.BytesIO()
-        img_obj.save(buf, format="PNG")
-        return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("utf-8")
-    except Exception as e:
-        print(f"Image Convert Error: {e}")
-        return ""
-
-# FUNGSI TAMBAHAN: Enhancement Citra (Pengganti RealESRGAN jika model belum load)
-def enhance_image_cv(pil_img):
-    try:
-        img_np = np.array(pil_img)
-        img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-        
-        # Menggunakan CLAHE (Contrast Limited Adaptive Histogram Equalization)
-        # untuk meningkatkan detail tekstur kulit/tulang
-        lab = cv2.cvtColor(img_cv, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        cl = clahe.apply(l)
-        limg = cv2.merge((cl,a,b))
-        final = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
-        final_rgb = cv2.cvtColor(final, cv2.COLOR_BGR2RGB)
-        
-        return Image.fromarray(final_rgb)
-    except Exception as e:
-        print(f"Enhancement Error: {e}")
-        return pil_img
-
-SCABIES_INFO = {
-    "description": "Scabies (kudis) adalah penyakit kulit menular yang disebabkan oleh tungau Sarcoptes scabiei.",
-    "treatment": "1. Krim Permethrin 5%.<br>2. Cuci pakaian dengan air panas.<br>3. Hindari kontak langsung."
-}
-
 @app.route('/')
 def index(): return render_template('index.html')
 
@@ -73,80 +25,89 @@ def process_image():
         file = request.files['file']
         analysis_type = request.form.get("type", "bone") 
         batch_id = request.form.get("batch_id", None)
+        types = parse_types(request.form)
         file_bytes = file.read()
         filename = file.filename
         
         # --- LOGIKA ECG ---
-        if analysis_type == 'ecg':
-            options = {
-                'rows': request.form.get('ecg_rows', 1),
-                'grid': request.form.get('ecg_grid', 'true'),
-                'details': request.form.get('ecg_details', 'false')
-            }
-            label, conf, explanation, plot_image = ecg_engine.predict_from_file(file_bytes, filename, options)
-            return jsonify({
-                "type": "ecg", "filename": filename, "label": label, "confidence": conf,
-                "explanation": explanation, "original_image": plot_image
-            })
+        if analysis_type == 'ecg' and not types:
+            result = analyze_ecg(file_bytes, filename, ecg_options(request.form))
+            return jsonify(store_result(result, file_bytes, batch_id))
 
         # --- LOGIKA GAMBAR ---
-        is_dicom = filename.lower().endswith('.dcm')
-        image_pil = None
-        viewer_url = None
-        study_uid = None
-        
-        if is_dicom:
-            orthanc_res = upload_dicom(file_bytes, batch_id)
-            if orthanc_res:
-                instance_id, study_uid, frames = orthanc_res
-                image_pil = get_orthanc_preview(instance_id)
-                viewer_url = f"http://localhost:8042/ohif/viewer?StudyInstanceUIDs={study_uid}"
-            else:
-                return jsonify({'error': 'Orthanc Upload Failed'}), 500
-        else:
-            try:
-                image_pil = Image.open(io.BytesIO(file_bytes)).convert("RGB")
-            except Exception as img_err:
-                return jsonify({'error': f"File bukan gambar valid: {str(img_err)}"}), 400
-        
-        result = {
-            "type": analysis_type,
-            "filename": filename,
-            "original_image": img_to_b64(image_pil),
-            "viewer_url": viewer_url,
-            "study_uid": study_uid
-        }
-
-        if analysis_type == 'brain':
-            label, conf, annotated, mask, expl, size = brain_engine.predict(image_pil)
-            result.update({ "label": label, "confidence": conf, "explanation": expl, "tumor_size": f"{size:.2f}%", "annotated_image": img_to_b64(annotated), "mask_image": img_to_b64(mask) })
-            
-        elif analysis_type == 'bone':
-            # Bone engine sudah mengembalikan enhanced image, tapi kita pastikan ada
-            label, conf, heatmap, all_preds, enhanced = bone_engine.predict(image_pil)
-            if enhanced is None: enhanced = enhance_image_cv(image_pil) # Fallback
-            result.update({ "label": label, "confidence": conf, "all_predictions": all_preds, "gradcam_image": img_to_b64(heatmap), "enhanced_image": img_to_b64(enhanced) })
-
-        elif analysis_type == 'skin':
-            label, conf, heatmap = skin_engine.predict(image_pil)
-            
-            # [FIX] Generate Enhanced Image secara manual di sini untuk fitur Scabies
-            enhanced_pil = enhance_image_cv(image_pil)
-            
-            skin_result = { 
-                "label": label, 
-                "confidence": conf, 
-                "gradcam_image": img_to_b64(heatmap),
-                "enhanced_image": img_to_b64(enhanced_pil) # Kirim data enhanced
-            }
-            if "scabies" in label.lower(): skin_result.update(SCABIES_INFO)
-            result.update(skin_result)
-
-        return jsonify(result)
+        image_pil, viewer_url, study_uid = load_image(file_bytes, filename, batch_id)
+
+        # --- FAN-OUT: satu upload, beberapa engine paralel ---
+        if types:
+            base = base_result('multi', filename, image_pil, viewer_url, study_uid)
+            per_type = run_fanout(types, image_pil, analysis_options(request.form))
+            return jsonify(fanout_response(base, per_type, file_bytes, batch_id))
 
+        result = base_result(analysis_type, filename, image_pil, viewer_url, study_uid)
+        result.update(run_analysis(analysis_type, image_pil, analysis_options(request.form)))
+        return jsonify(store_result(encode_artifacts(result), file_bytes, batch_id))
+
+    except AnalysisError as e:
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         print(f"Server Error: {e}")
         return jsonify({'error': str(e)}), 500
 
+# --- STREAMING ECG ---
+# Client membuat sesi, lalu mengirim chunk sampel berurutan; setiap respons berisi
+# beat baru yang sudah terklasifikasi. Mode ASGI menyediakan versi WebSocket.
+@app.route('/ecg-stream', methods=['POST'])
+def start_ecg_stream():
+    try:
+        return jsonify(create_ecg_stream(request.get_json(silent=True) or request.form))
+    except AnalysisError as e:
+        return jsonify({'error': e.message}), e.status
+
+@app.route('/ecg-stream/<session_id>', methods=['POST'])
+def ecg_stream_chunk(session_id):
+    try:
+        return jsonify(push_ecg_stream(session_id, request.get_json(silent=True)))
+    except AnalysisError as e:
+        return jsonify({'error': e.message}), e.status
+
+@app.route('/ecg-stream/<session_id>', methods=['DELETE'])
+def stop_ecg_stream(session_id):
+    if not ecg_streams.close(session_id): return jsonify({'error': 'Unknown stream session'}), 404
+    return jsonify({'session_id': session_id, 'status': 'closed'})
+
+# --- TRIAGE ---
+@app.route('/triage-stats', methods=['GET'])
+def get_triage_stats():
+    return jsonify(triage_stats.summary())
+
+# --- RESULT STORE ---
+@app.route('/results', methods=['GET'])
+def list_results():
+    try:
+        return jsonify(query_results(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/results/<int:result_id>', methods=['GET'])
+def get_result(result_id):
+    item = result_store.get(result_id)
+    if item is None: return jsonify({'error': 'Result not found'}), 404
+    return jsonify(item)
+
+# --- MODEL REGISTRY ---
+@app.route('/models', methods=['GET'])
+def list_models():
+    return jsonify(registry.describe())
+
+@app.route('/models/rescan', methods=['POST'])
+def rescan_models():
+    registry.scan()
+    return jsonify(registry.describe())
+
+@app.route('/models/<engine_name>/<action>', methods=['POST'])
+def model_registry_action(engine_name, action):
+    payload, status = model_action(engine_name, action, request.get_json(silent=True) or request.form)
+    return jsonify(payload), status
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,196 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from quart import Quart, request, websocket, jsonify, render_template, send_from_directory
+from quart_cors import cors
+
+from utils.orthanc_client import prepare_dicom, upload_dicom_async, get_orthanc_preview_bytes_async
+from pipeline import (
+    registry, AnalysisError, ORTHANC_VIEWER_URL, ecg_options, analysis_options, is_dicom,
+    decode_image_bytes, analyze_ecg, base_result, run_analysis, encode_artifacts, model_action,
+    store_result, query_results, result_store,
+    ecg_streams, create_ecg_stream, push_ecg_stream, triage_stats,
+    parse_types, fanout_response
+)
+
+# ===========================================
+# Mode serving ASGI (async)
+# ===========================================
+# Jalankan dengan: hypercorn asgi:app --bind 0.0.0.0:5000
+# I/O (upload, Orthanc) di-await; inference CPU/GPU dijalankan di thread pool
+# per engine, encoding artefak & decode gambar di pool terpisah.
+ENGINE_WORKERS = {
+    # Default 1: setiap detector memproses satu request sekaligus (lihat utils/sync.py)
+    name: int(os.environ.get(f"MDH_WORKERS_{name.upper()}", 1)) for name in ("bone", "brain", "skin", "ecg")
+}
+ARTIFACT_WORKERS = int(os.environ.get("MDH_WORKERS_ARTIFACT", 4))
+ORTHANC_TIMEOUT = float(os.environ.get("MDH_ORTHANC_TIMEOUT", 60))
+
+engine_pools = {name: ThreadPoolExecutor(max_workers=n, thread_name_prefix=f"{name}-engine") for name, n in ENGINE_WORKERS.items()}
+artifact_pool = ThreadPoolExecutor(max_workers=ARTIFACT_WORKERS, thread_name_prefix="artifact")
+
+app = Quart(__name__, static_folder='static', template_folder='templates')
+app = cors(app, allow_origin="*")
+
+async def run_in(pool, fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, functools.partial(fn, *args))
+
+@app.before_serving
+async def startup():
+    app.orthanc = httpx.AsyncClient(timeout=ORTHANC_TIMEOUT)
+
+@app.after_serving
+async def shutdown():
+    await app.orthanc.aclose()
+    for pool in [*engine_pools.values(), artifact_pool]:
+        pool.shutdown(wait=False)
+
+async def load_image_async(file_bytes, filename, batch_id=None):
+    """Versi async dari pipeline.load_image: Orthanc di-await, decode di artifact pool."""
+    if not is_dicom(filename):
+        return await run_in(artifact_pool, decode_image_bytes, file_bytes), None, None
+
+    modified_bytes = await run_in(artifact_pool, prepare_dicom, file_bytes, batch_id)
+    orthanc_res = await upload_dicom_async(app.orthanc, modified_bytes)
+    if not orthanc_res:
+        raise AnalysisError('Orthanc Upload Failed', 500)
+    instance_id, study_uid, frames = orthanc_res
+
+    preview_bytes = await get_orthanc_preview_bytes_async(app.orthanc, instance_id)
+    image_pil = await run_in(artifact_pool, decode_image_bytes, preview_bytes) if preview_bytes else None
+    return image_pil, ORTHANC_VIEWER_URL.format(study_uid), study_uid
+
+@app.route('/')
+async def index(): return await render_template('index.html')
+
+@app.route('/static/<path:filename>')
+async def serve_static(filename): return await send_from_directory('static', filename)
+
+@app.route('/process-image', methods=['POST'])
+async def process_image():
+    try:
+        files = await request.files
+        form = await request.form
+        if 'file' not in files: return jsonify({'error': 'No file uploaded'}), 400
+        file = files['file']
+        analysis_type = form.get("type", "bone")
+        batch_id = form.get("batch_id", None)
+        types = parse_types(form)
+        file_bytes = file.read()
+        filename = file.filename
+
+        # --- LOGIKA ECG ---
+        if analysis_type == 'ecg' and not types:
+            result = await run_in(engine_pools['ecg'], analyze_ecg, file_bytes, filename, ecg_options(form))
+            return jsonify(await run_in(artifact_pool, store_result, result, file_bytes, batch_id))
+
+        # --- LOGIKA GAMBAR ---
+        image_pil, viewer_url, study_uid = await load_image_async(file_bytes, filename, batch_id)
+
+        # --- FAN-OUT: satu upload, tiap engine di pool-nya sendiri secara paralel ---
+        if types:
+            options = analysis_options(form)
+            outputs = await asyncio.gather(*[
+                run_in(engine_pools[t], run_analysis, t, image_pil, options) for t in types
+            ])
+            base = base_result('multi', filename, image_pil, viewer_url, study_uid)
+            return jsonify(await run_in(artifact_pool, fanout_response, base, dict(zip(types, outputs)), file_bytes, batch_id))
+
+        result = base_result(analysis_type, filename, image_pil, viewer_url, study_uid)
+        if analysis_type in engine_pools:
+            result.update(await run_in(engine_pools[analysis_type], run_analysis, analysis_type, image_pil, analysis_options(form)))
+        result = await run_in(artifact_pool, encode_artifacts, result)
+        return jsonify(await run_in(artifact_pool, store_result, result, file_bytes, batch_id))
+
+    except AnalysisError as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        print(f"Server Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# --- STREAMING ECG ---
+@app.route('/ecg-stream', methods=['POST'])
+async def start_ecg_stream():
+    try:
+        return jsonify(create_ecg_stream(await request.get_json(silent=True) or await request.form))
+    except AnalysisError as e:
+        return jsonify({'error': e.message}), e.status
+
+@app.route('/ecg-stream/<session_id>', methods=['POST'])
+async def ecg_stream_chunk(session_id):
+    try:
+        payload = await request.get_json(silent=True)
+        return jsonify(await run_in(engine_pools['ecg'], push_ecg_stream, session_id, payload))
+    except AnalysisError as e:
+        return jsonify({'error': e.message}), e.status
+
+@app.route('/ecg-stream/<session_id>', methods=['DELETE'])
+async def stop_ecg_stream(session_id):
+    if not ecg_streams.close(session_id): return jsonify({'error': 'Unknown stream session'}), 404
+    return jsonify({'session_id': session_id, 'status': 'closed'})
+
+@app.websocket('/ecg-stream/ws')
+async def ecg_stream_ws():
+    """
+    Koneksi long-lived: kirim {"samples": [...]} berulang kali, server membalas
+    beat baru untuk tiap chunk. Sesi otomatis ditutup saat koneksi putus.
+    """
+    try:
+        session = create_ecg_stream(websocket.args)
+    except AnalysisError as e:
+        await websocket.send_json({'error': e.message})
+        return
+    await websocket.send_json({"session_id": session["session_id"], "fs": session["fs"]})
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            try:
+                res = await run_in(engine_pools['ecg'], push_ecg_stream, session["session_id"], payload)
+            except AnalysisError as e:
+                res = {'error': e.message}
+            await websocket.send_json(res)
+    finally:
+        ecg_streams.close(session["session_id"])
+
+# --- TRIAGE ---
+@app.route('/triage-stats', methods=['GET'])
+async def get_triage_stats():
+    return jsonify(triage_stats.summary())
+
+# --- RESULT STORE ---
+@app.route('/results', methods=['GET'])
+async def list_results():
+    try:
+        return jsonify(await run_in(artifact_pool, query_results, request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/results/<int:result_id>', methods=['GET'])
+async def get_result(result_id):
+    item = await run_in(artifact_pool, result_store.get, result_id)
+    if item is None: return jsonify({'error': 'Result not found'}), 404
+    return jsonify(item)
+
+# --- MODEL REGISTRY ---
+@app.route('/models', methods=['GET'])
+async def list_models():
+    return jsonify(registry.describe())
+
+@app.route('/models/rescan', methods=['POST'])
+async def rescan_models():
+    # Hashing file weight bisa lama, jangan blok event loop
+    await run_in(artifact_pool, registry.scan)
+    return jsonify(registry.describe())
+
+@app.route('/models/<engine_name>/<action>', methods=['POST'])
+async def model_registry_action(engine_name, action):
+    params = await request.get_json(silent=True) or await request.form
+    payload, status = await run_in(artifact_pool, model_action, engine_name, action, params)
+    return jsonify(payload), status
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,286 @@
+"""
+Bulk inference offline (tanpa HTTP) untuk re-screening arsip.
+
+Contoh:
+    python bulk_infer.py /data/archive --type bone --output bone.jsonl
+    python bulk_infer.py studies.zip --type brain --output brain_out --format parquet
+    python bulk_infer.py /media/cd/DICOMDIR --type bone --output cd.jsonl --resume
+"""
+import io
+import os
+import sys
+import json
+import time
+import zipfile
+import argparse
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from PIL import Image
+
+from utils.model_registry import ModelRegistry, DEFAULT_WEIGHTS, DEFAULT_VERSION
+from utils.dicom_utils import dicom_to_pil, read_dicomdir
+from modules.bone_detection import BoneDetector
+from modules.brain_detection import BrainTumorDetector
+from modules.skin_detection import SkinDetector
+from modules.ecg_detection import ECGDetector
+
+ENGINES = {"bone": BoneDetector, "brain": BrainTumorDetector, "skin": SkinDetector, "ecg": ECGDetector}
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.dcm')
+ECG_EXTENSIONS = ('.csv', '.txt', '.ecg')
+ROWS_PER_PART = 1000  # Jumlah baris per file part Parquet
+INFERENCE_ERROR = "Inference error"  # Prefix error inference; key-nya tidak di-checkpoint agar dicoba lagi saat --resume
+
+# ===========================================
+# Sumber file: folder, zip, atau DICOMDIR
+# ===========================================
+def iter_sources(source, extensions):
+    """Yield (key, read_fn). key dipakai sebagai identitas untuk checkpoint."""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for fname in sorted(files):
+                if fname.lower().endswith(extensions):
+                    path = os.path.join(root, fname)
+                    yield os.path.relpath(path, source), lambda p=path: open(p, 'rb').read()
+    elif zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+        for name in sorted(archive.namelist()):
+            if name.lower().endswith(extensions):
+                yield name, lambda n=name: archive.read(n)
+    elif os.path.basename(source).upper() == "DICOMDIR":
+        # File di dalam DICOMDIR biasanya tanpa ekstensi, semuanya DICOM
+        root = os.path.dirname(os.path.abspath(source))
+        for path in read_dicomdir(source):
+            yield os.path.relpath(path, root), lambda p=path: open(p, 'rb').read()
+    else:
+        raise ValueError(f"Unsupported source: {source}")
+
+# ===========================================
+# Decode (berjalan di worker thread)
+# ===========================================
+def make_decoder(analysis_type, engine, dicom_source):
+    def decode(item):
+        key, read_fn = item
+        try:
+            data = read_fn()
+            if analysis_type == 'ecg':
+                signal = engine.parse_file_to_signal(data, key)
+                if signal is None or len(signal) == 0: raise ValueError("Gagal membaca format file.")
+                beat = engine.extract_heartbeat(signal, target_len=187)
+                if beat is None: raise ValueError("Gagal mengekstrak detak jantung.")
+                return key, beat, None
+            if dicom_source or key.lower().endswith('.dcm'):
+                return key, dicom_to_pil(data), None
+            return key, Image.open(io.BytesIO(data)).convert("RGB"), None
+        except Exception as e:
+            return key, None, str(e)
+    return decode
+
+def prefetch(items, fn, workers, depth):
+    """Map paralel dengan jumlah item in-flight dibatasi `depth` (memori terkendali), urutan tetap."""
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode") as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# ===========================================
+# Output & checkpoint
+# ===========================================
+class JsonlWriter:
+    def __init__(self, path):
+        self.f = open(path, 'a', encoding='utf-8')
+        self.buffer = []
+
+    def add(self, rows):
+        self.buffer.extend(rows)
+
+    def flush(self, force=False):
+        """Tulis baris yang di-buffer secara durable; mengembalikan key yang sudah aman."""
+        for row in self.buffer:
+            self.f.write(json.dumps(row) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        keys, self.buffer = [r["key"] for r in self.buffer], []
+        return keys
+
+    def close(self):
+        self.f.close()
+
+class ParquetWriter:
+    """Output Parquet sebagai folder berisi part-XXXXX.parquet (resume = tambah part baru)."""
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("Parquet output requires pyarrow (pip install pyarrow).")
+        self.pa, self.pq = pa, pq
+        # Schema eksplisit: part yang isinya semua null (mis. error) tetap bertipe sama
+        self.schema = pa.schema([
+            ("key", pa.string()), ("type", pa.string()), ("label", pa.string()),
+            ("confidence", pa.float64()), ("details", pa.string()), ("error", pa.string()),
+            ("model_version", pa.string()), ("model_sha256", pa.string()),
+            ("batch_id", pa.string()), ("processed_at", pa.string()),
+        ])
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.part = len([f for f in os.listdir(path) if f.endswith('.parquet')])
+        self.buffer = []
+
+    def add(self, rows):
+        self.buffer.extend(rows)
+
+    def flush(self, force=False):
+        if not self.buffer or (len(self.buffer) < ROWS_PER_PART and not force):
+            return []
+        table = self.pa.Table.from_pylist(self.buffer, schema=self.schema)
+        self.pq.write_table(table, os.path.join(self.path, f"part-{self.part:05d}.parquet"))
+        self.part += 1
+        keys, self.buffer = [r["key"] for r in self.buffer], []
+        return keys
+
+    def close(self):
+        pass
+
+class Checkpoint:
+    """File teks berisi key yang sudah ditulis ke output (satu per baris)."""
+    def __init__(self, path, resume):
+        self.path = path
+        self.done = set()
+        if resume and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self.f = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def add(self, keys):
+        if not keys: return
+        self.f.write("".join(k + "\n" for k in keys))
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.done.update(keys)
+
+    def close(self):
+        self.f.close()
+
+# ===========================================
+# Main loop
+# ===========================================
+def classify(analysis_type, engine, payloads):
+    if analysis_type == 'ecg':
+        return [(label, conf, {}) for label, conf in engine.classify_beats(payloads)]
+    return engine.classify_batch(payloads)
+
+def run(args):
+    extensions = ECG_EXTENSIONS if args.type == 'ecg' else IMAGE_EXTENSIONS
+    checkpoint_path = args.output.rstrip("/\\") + ".ckpt"
+    output_exists = os.path.exists(args.output) or os.path.exists(checkpoint_path)
+    if output_exists and not (args.resume or args.overwrite):
+        sys.exit(f"{args.output} already exists; use --resume to continue or --overwrite to start over.")
+    if args.overwrite and not args.resume:
+        if os.path.isfile(args.output):
+            os.remove(args.output)
+        elif os.path.isdir(args.output):
+            for fname in os.listdir(args.output):
+                if fname.endswith('.parquet'): os.remove(os.path.join(args.output, fname))
+
+    torch.set_num_threads(args.threads)
+
+    # Load engine lewat registry agar versi & hash weight tercatat di output
+    registry = ModelRegistry(args.models_dir)
+    slot = registry.register(args.type, ENGINES[args.type], DEFAULT_WEIGHTS[args.type], load=False)
+    engine = slot.load(args.version)
+    if getattr(engine, "model", None) is None:
+        sys.exit(f"Model for '{args.type}' could not be loaded.")
+    entry = registry.find(args.type, args.version) or {}
+
+    checkpoint = Checkpoint(checkpoint_path, args.resume)
+    writer = ParquetWriter(args.output) if args.format == 'parquet' else JsonlWriter(args.output)
+
+    dicom_source = os.path.basename(args.source).upper() == "DICOMDIR"
+    items = (item for item in iter_sources(args.source, extensions) if item[0] not in checkpoint.done)
+    decoded = prefetch(items, make_decoder(args.type, engine, dicom_source), args.workers, args.prefetch)
+
+    def make_row(key, label=None, conf=None, extra=None, error=None):
+        return {
+            "key": key, "type": args.type, "label": label, "confidence": conf,
+            "details": json.dumps(extra or {}), "error": error,
+            "model_version": args.version, "model_sha256": entry.get("sha256"),
+            "batch_id": args.batch_id, "processed_at": datetime.now().isoformat(timespec="seconds")
+        }
+
+    print(f"[Bulk] {args.type} | source={args.source} | skipped (checkpoint)={len(checkpoint.done)}")
+    started, processed = time.time(), 0
+    batch_keys, batch_payloads = [], []
+    failed_keys = set()  # Key dengan error inference (transient, mis. OOM) -> tidak di-checkpoint
+
+    def save(keys):
+        checkpoint.add([k for k in keys if k not in failed_keys])
+
+    def run_batch():
+        nonlocal processed
+        if not batch_keys: return
+        try:
+            outputs = classify(args.type, engine, batch_payloads)
+            writer.add([make_row(k, label, conf, extra) for k, (label, conf, extra) in zip(batch_keys, outputs)])
+        except Exception as e:
+            # Satu file bermasalah jangan menggagalkan seluruh batch: ulangi per item
+            print(f"[Bulk] Batch failed ({e}), retrying {len(batch_keys)} items individually")
+            for key, payload in zip(batch_keys, batch_payloads):
+                try:
+                    (label, conf, extra), = classify(args.type, engine, [payload])
+                    writer.add([make_row(key, label, conf, extra)])
+                except Exception as item_error:
+                    failed_keys.add(key)
+                    writer.add([make_row(key, error=f"{INFERENCE_ERROR}: {item_error}")])
+        processed += len(batch_keys)
+        batch_keys.clear(); batch_payloads.clear()
+        save(writer.flush())
+        rate = processed / max(time.time() - started, 1e-6)
+        print(f"[Bulk] processed={processed} ({rate:.1f} files/s)")
+
+    try:
+        for key, payload, error in decoded:
+            if error:
+                writer.add([make_row(key, error=error)])
+                continue
+            batch_keys.append(key)
+            batch_payloads.append(payload)
+            if len(batch_keys) >= args.batch_size:
+                run_batch()
+        run_batch()
+        save(writer.flush(force=True))
+    finally:
+        writer.close()
+        checkpoint.close()
+
+    print(f"[Bulk] Done: {processed} files in {time.time() - started:.1f}s -> {args.output}")
+    if failed_keys:
+        print(f"[Bulk] {len(failed_keys)} files had inference errors and will be retried with --resume")
+
+def parse_args(argv=None):
+    cpu = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Offline bulk inference for MedicalDiagnosticHub detectors.")
+    parser.add_argument("source", help="Folder, file .zip, atau DICOMDIR")
+    parser.add_argument("--type", required=True, choices=sorted(ENGINES), help="Engine analisis")
+    parser.add_argument("--output", required=True, help="File .jsonl atau folder Parquet")
+    parser.add_argument("--format", default="jsonl", choices=["jsonl", "parquet"])
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=cpu, help="Thread decode (default: jumlah core)")
+    parser.add_argument("--prefetch", type=int, default=64, help="Maksimum file ter-decode yang menunggu inference")
+    parser.add_argument("--threads", type=int, default=cpu, help="Thread intra-op PyTorch")
+    parser.add_argument("--models-dir", default="Models")
+    parser.add_argument("--version", default=DEFAULT_VERSION, help="Versi model di registry (lihat Models/<engine>/)")
+    parser.add_argument("--batch-id", default=None, help="Label bebas yang dicatat di setiap baris output")
+    parser.add_argument("--resume", action="store_true", help="Lanjutkan dari checkpoint <output>.ckpt")
+    parser.add_argument("--overwrite", action="store_true", help="Mulai ulang dan timpa output yang ada")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    run(parse_args())
@@ -1,4 +1,5 @@
 import os
+import threading
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -6,7 +7,9 @@ import cv2
 import numpy as np
 from PIL import Image
 from torchvision import models, transforms
-from utils.gradcam import generate_heatmap
+from utils.gradcam import generate_heatmap, generate_cam_batch, overlay_heatmap_on_image
+from utils.precision import optimize_model, autocast, to_model_layout, reference_image_batch
+from utils.sync import synchronized
 
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -17,9 +20,39 @@ data_transforms = transforms.Compose([
     transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
 ])
 
+# Preprocessing tile (resolusi asli, tanpa resize)
+tile_transforms = transforms.Compose([
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+])
+
+# Konfigurasi Tiled Inference
+TILE_SIZE = 224
+TILE_OVERLAP = 32
+TILE_BATCH_SIZE = 16
+BG_MIN_MEAN = 20    # Tile lebih gelap dari ini dianggap background
+BG_MIN_STD = 8      # Tile yang terlalu rata (tanpa tekstur) dianggap background
+# Agregasi tile -> keputusan gambar. Satu tile saja mudah false positive (artefak,
+# tepi kolimasi), jadi gambar dinyatakan abnormal bila minimal TILE_MIN_SUSPICIOUS
+# tile punya skor abnormal (1 - P(Healthy)) >= TILE_ABNORMAL_THRESHOLD.
+# Nilai ini sebaiknya dikalibrasi ulang pada validation set per versi model.
+TILE_ABNORMAL_THRESHOLD = 0.5
+TILE_MIN_SUSPICIOUS = 2
+
+def _tile_starts(length, tile, stride):
+    """Posisi awal tile sepanjang satu sumbu; tile terakhir selalu menempel ke tepi."""
+    if length <= tile: return [0]
+    starts = list(range(0, length - tile + 1, stride))
+    if starts[-1] != length - tile: starts.append(length - tile)
+    return starts
+
 class BoneDetector:
     def __init__(self, model_path="Models/bone_best.pth"):
         self.model = None
+        self.load_error = None
+        self.lock = threading.RLock()  # Satu request per detector (hooks GradCAM bersifat global per model)
+        self.amp_dtype = None
+        self.channels_last = False
         self.classes = ['Healthy', 'Fracture', 'Avulsion', 'Comminuted', 'Greenstick', 'Hairline', 'Impacted', 'Longitudinal', 'Oblique', 'Spiral']
         self.load_model(model_path)
 
@@ -46,10 +79,12 @@ class BoneDetector:
             # PENTING: Pindahkan ke DEVICE dan set eval
             self.model.to(DEVICE)
             self.model.eval()
+            self.model, self.amp_dtype, self.channels_last = optimize_model(self.model, reference_image_batch(), DEVICE, "Bone")
             print("[Bone] Model loaded successfully.")
         except Exception as e:
             print(f"[Bone] Error loading model: {e}")
             self.model = None
+            self.load_error = str(e)
 
     def enhance_image(self, img_pil):
         """
@@ -68,28 +103,25 @@ class BoneDetector:
             print(f"Enhancement Error: {e}")
             return img_pil
 
-    def predict(self, img_pil):
+    @synchronized
+    def predict(self, img_pil, render_artifacts=None):
+        """
+        render_artifacts(label, confidence, artifacts) -> bool (opsional, mode triage):
+        jika False, heatmap & enhanced image tidak dibuat (dikembalikan None).
+        """
         if not self.model:
             return "Model Error", 0.0, None, {}, img_pil
 
-        # 1. Enhance Image
-        enhanced_pil = self.enhance_image(img_pil)
-
-        # 2. Prepare Tensor & Move to Device
-        img_tensor = data_transforms(img_pil).unsqueeze(0).to(DEVICE)
-        
-        # PERBAIKAN 1: Wajib set True agar GradCAM bisa jalan
-        img_tensor.requires_grad = True
+        # 1. Prepare Tensor & Move to Device
+        img_tensor = to_model_layout(data_transforms(img_pil).unsqueeze(0).to(DEVICE), self.channels_last)
         
-        # 3. Predict
+        # 2. Predict
         try:
-            # PERBAIKAN 2: HAPUS 'with torch.no_grad():'
-            # Kita biarkan gradient mengalir untuk GradCAM
-            
-            self.model.zero_grad() # Reset gradient sebelumnya
-            
-            outputs = self.model(img_tensor)
-            probs = F.softmax(outputs, dim=1)
+            # Forward klasifikasi tanpa autograd: generate_heatmap membuat graph
+            # sendiri (clone + requires_grad) untuk GradCAM
+            with torch.no_grad(), autocast(DEVICE, self.amp_dtype):
+                outputs = self.model(img_tensor)
+                probs = F.softmax(outputs.float(), dim=1)
             conf_score, preds = torch.max(probs, 1)
             
             label = self.classes[preds.item()]
@@ -97,12 +129,150 @@ class BoneDetector:
             
             all_predictions = {c: f"{probs[0][i].item()*100:.1f}" for i, c in enumerate(self.classes)}
             
-            # 4. Generate Heatmap (Sekarang akan berhasil karena ada gradient)
+            # Early exit triage: hasil negatif yang yakin tidak perlu artefak
+            if render_artifacts and not render_artifacts(label, confidence, ("gradcam_image", "enhanced_image")):
+                return label, confidence, None, all_predictions, None
+            
+            # 3. Generate Heatmap (fp32, di luar autocast: gradient bf16/fp16 membuat CAM kasar)
             heatmap_pil = generate_heatmap(img_tensor, self.model, self.model.layer4[-1])
             
+            # 4. Enhance Image
+            enhanced_pil = self.enhance_image(img_pil)
+            
             return label, confidence, heatmap_pil, all_predictions, enhanced_pil
             
         except Exception as e:
             print(f"[Bone Prediction Error] {e}")
-            # Return safe values on error
-            return "Error", 0.0, None, {}, enhanced_pil
\ No newline at end of file
+            # Return safe values on error (enhanced dibuat ulang oleh caller)
+            return "Error", 0.0, None, {}, None
+
+    @synchronized
+    def classify_batch(self, images):
+        """
+        Klasifikasi batch tanpa artefak (dipakai bulk CLI).
+        Mengembalikan list (label, confidence, {"all_predictions": ...}).
+        """
+        if not self.model:
+            return [("Model Error", 0.0, {})] * len(images)
+
+        batch = torch.stack([data_transforms(img) for img in images]).to(DEVICE)
+        batch = to_model_layout(batch, self.channels_last)
+        with torch.no_grad(), autocast(DEVICE, self.amp_dtype):
+            probs = F.softmax(self.model(batch).float(), dim=1).cpu()
+
+        outputs = []
+        for p in probs:
+            idx = int(p.argmax())
+            all_predictions = {c: f"{p[i].item()*100:.1f}" for i, c in enumerate(self.classes)}
+            outputs.append((self.classes[idx], p[idx].item() * 100, {"all_predictions": all_predictions}))
+        return outputs
+
+    def is_background_tile(self, gray_tile):
+        """Pre-filter murah: cek intensitas & kontras pada tile yang di-subsample."""
+        sample = gray_tile[::4, ::4]
+        return sample.mean() < BG_MIN_MEAN or sample.std() < BG_MIN_STD
+
+    @synchronized
+    def predict_tiled(self, img_pil, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=TILE_BATCH_SIZE):
+        """
+        Inferensi high-resolution: gambar dipotong menjadi tile overlap berukuran asli,
+        diproses per batch, lalu logits & Grad-CAM tiap tile dijahit menjadi heatmap penuh.
+        Return sama dengan predict() ditambah dict statistik tiling.
+        """
+        if not self.model:
+            return "Model Error", 0.0, None, {}, img_pil, {}
+
+        enhanced_pil = self.enhance_image(img_pil)
+
+        img_rgb = np.array(img_pil.convert("RGB"))
+        orig_h, orig_w = img_rgb.shape[:2]
+
+        # Gambar lebih kecil dari tile -> pad agar minimal satu tile penuh
+        pad_h, pad_w = max(0, tile_size - orig_h), max(0, tile_size - orig_w)
+        if pad_h or pad_w:
+            img_rgb = np.pad(img_rgb, ((0, pad_h), (0, pad_w), (0, 0)), mode='constant')
+        h, w = img_rgb.shape[:2]
+        gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+
+        stride = max(1, tile_size - overlap)
+        positions = [(y, x) for y in _tile_starts(h, tile_size, stride) for x in _tile_starts(w, tile_size, stride)]
+        foreground = [(y, x) for (y, x) in positions if not self.is_background_tile(gray[y:y+tile_size, x:x+tile_size])]
+
+        tile_info = {
+            "tile_size": tile_size, "overlap": overlap,
+            "tiles_total": len(positions), "tiles_processed": len(foreground),
+            "tiles_skipped": len(positions) - len(foreground)
+        }
+
+        # Tidak ada anatomi yang terdeteksi -> fallback ke prediksi biasa
+        if not foreground:
+            label, conf, heatmap_pil, all_predictions, enhanced_pil = self.predict(img_pil)
+            return label, conf, heatmap_pil, all_predictions, enhanced_pil, tile_info
+
+        healthy_idx = self.classes.index('Healthy') if 'Healthy' in self.classes else None
+
+        def select_abnormal(logits):
+            # Grad-CAM diarahkan ke kelas abnormal paling mungkin di tiap tile
+            if healthy_idx is None: return logits.argmax(dim=1)
+            masked = logits.clone()
+            masked[:, healthy_idx] = float('-inf')
+            return masked.argmax(dim=1)
+
+        heat_acc = np.zeros((h, w), dtype=np.float32)
+        count_acc = np.zeros((h, w), dtype=np.float32)
+        tile_probs = []
+
+        try:
+            # Batch dibatasi batch_size agar memori tetap terkendali
+            for b in range(0, len(foreground), batch_size):
+                chunk = foreground[b:b + batch_size]
+                batch = torch.stack([
+                    tile_transforms(Image.fromarray(img_rgb[y:y+tile_size, x:x+tile_size])) for (y, x) in chunk
+                ]).to(DEVICE)
+                batch = to_model_layout(batch, self.channels_last)
+
+                # Forward + backward Grad-CAM dalam fp32 (tanpa autocast) agar CAM tile akurat
+                logits, cams = generate_cam_batch(batch, self.model, self.model.layer4[-1], select_abnormal)
+                probs = F.softmax(logits.float(), dim=1).cpu().numpy()
+
+                for (y, x), cam, p in zip(chunk, cams, probs):
+                    score = 1.0 - p[healthy_idx] if healthy_idx is not None else p.max()
+                    heat_acc[y:y+tile_size, x:x+tile_size] += cv2.resize(cam, (tile_size, tile_size)) * score
+                    count_acc[y:y+tile_size, x:x+tile_size] += 1
+                    tile_probs.append(p)
+
+            tile_probs = np.stack(tile_probs)
+
+            if healthy_idx is not None:
+                # Keputusan gambar: butuh beberapa tile mencurigakan, bukan satu tile terburuk
+                suspicious = (1.0 - tile_probs[:, healthy_idx]) >= TILE_ABNORMAL_THRESHOLD
+                min_suspicious = min(TILE_MIN_SUSPICIOUS, len(tile_probs))
+                tile_info["tiles_suspicious"] = int(suspicious.sum())
+                if suspicious.sum() >= min_suspicious:
+                    image_probs = tile_probs[suspicious].mean(axis=0)
+                    abnormal = image_probs.copy()
+                    abnormal[healthy_idx] = -1.0
+                    pred_idx = int(np.argmax(abnormal))
+                else:
+                    image_probs = tile_probs.mean(axis=0)
+                    pred_idx = healthy_idx
+            else:
+                image_probs = tile_probs.mean(axis=0)
+                pred_idx = int(np.argmax(image_probs))
+
+            label = self.classes[pred_idx]
+            confidence = float(image_probs[pred_idx]) * 100
+            all_predictions = {c: f"{image_probs[i]*100:.1f}" for i, c in enumerate(self.classes)}
+
+            # Stitching heatmap full-resolution. Tidak dinormalisasi ke max-nya sendiri:
+            # CAM tiap tile sudah 0-1 dan dikali skor abnormal, sehingga gambar sehat
+            # tetap terlihat "dingin" dan intensitas bisa dibandingkan antar gambar.
+            heat = heat_acc / np.maximum(count_acc, 1)
+            heat = np.clip(heat[:orig_h, :orig_w], 0.0, 1.0)
+            heatmap_pil = overlay_heatmap_on_image(heat, img_rgb[:orig_h, :orig_w])
+
+            return label, confidence, heatmap_pil, all_predictions, enhanced_pil, tile_info
+
+        except Exception as e:
+            print(f"[Bone Tiled Prediction Error] {e}")
+            return "Error", 0.0, None, {}, enhanced_pil, tile_info
@@ -1,12 +1,23 @@
 import os
+import threading
 import cv2
 import numpy as np
 from PIL import Image
 from ultralytics import YOLO
+from utils.sync import synchronized
+
+DETECTION_CONF = 0.25  # Box di atas threshold ini dianggap tumor (dilaporkan & dianotasi)
+# YOLO dijalankan dengan threshold rendah agar box lemah tetap terlihat;
+# skor box tertinggi dipakai untuk menghitung confidence hasil negatif.
+CANDIDATE_CONF = 0.01
+
+def is_tumor_label(label):
+    return label != 'No Tumor' and "no_tumor" not in label.lower()
 
 class BrainTumorDetector:
     def __init__(self, model_path="Models/brain-model-2.pt"):
         self.model = None
+        self.lock = threading.RLock()  # Predictor YOLO menyimpan state per panggilan
         self.load_model(model_path)
 
     def load_model(self, path):
@@ -16,7 +27,47 @@ class BrainTumorDetector:
         else:
             print(f"[Brain] Warning: Model file not found at {path}")
 
-    def predict(self, img_pil):
+    def summarize_detections(self, detected_objects):
+        """
+        Menentukan (label, confidence, explanation) dari daftar deteksi YOLO (termasuk box
+        di bawah DETECTION_CONF). Confidence negatif = 1 - skor box tumor tertinggi.
+        """
+        tumors = [d for d in detected_objects if is_tumor_label(d['label'])]
+        valid_tumors = [d for d in tumors if d['confidence'] >= DETECTION_CONF]
+        if valid_tumors:
+            best = max(valid_tumors, key=lambda x: x['confidence'])
+            return best['label'], best['confidence'] * 100, "AI detected a tumor anomaly. Radiological verification recommended."
+        top_score = max((d['confidence'] for d in tumors), default=0.0)
+        return "No Tumor", (1.0 - top_score) * 100, "No tumor anomalies detected."
+
+    @synchronized
+    def classify_batch(self, images):
+        """
+        Deteksi batch tanpa anotasi/segmentasi (dipakai bulk CLI).
+        Mengembalikan list (label, confidence, {"detections": n}).
+        """
+        if not self.model:
+            return [("Model Missing", 0.0, {})] * len(images)
+
+        results = self.model.predict(source=[np.array(img) for img in images], conf=CANDIDATE_CONF, verbose=False)
+        outputs = []
+        for res in results:
+            names = res.names
+            detected_objects = [
+                {"label": names[int(c)], "confidence": conf}
+                for c, conf in zip(res.boxes.cls.cpu().numpy().tolist(), res.boxes.conf.cpu().numpy().tolist())
+            ]
+            label, conf, _ = self.summarize_detections(detected_objects)
+            n_detections = sum(1 for d in detected_objects if d['confidence'] >= DETECTION_CONF)
+            outputs.append((label, conf, {"detections": n_detections}))
+        return outputs
+
+    @synchronized
+    def predict(self, img_pil, render_artifacts=None):
+        """
+        render_artifacts(label, confidence, artifacts) -> bool (opsional, mode triage):
+        jika False, anotasi & segmentasi dilewati (gambar None, ukuran 0).
+        """
         if not self.model:
             return "Model Missing", 0.0, None, None, "Model file not found.", 0.0
 
@@ -26,7 +77,7 @@ class BrainTumorDetector:
         h, w = img_rgb.shape[:2]
 
         # YOLO Inference
-        results = self.model.predict(source=img_rgb, conf=0.25, verbose=False)
+        results = self.model.predict(source=img_rgb, conf=CANDIDATE_CONF, verbose=False)
         res = results[0]
         
         boxes = res.boxes.xyxy.cpu().numpy().tolist()
@@ -34,17 +85,25 @@ class BrainTumorDetector:
         confs = res.boxes.conf.cpu().numpy().tolist()
         names = res.names
 
+        detected_objects = [{"label": names[int(c)], "confidence": conf} for c, conf in zip(classes, confs)]
+
+        # Classification Logic
+        final_label, final_conf, explanation = self.summarize_detections(detected_objects)
+
+        # Early exit triage: lewati anotasi & segmentasi. Mask hanya dibuat bila ada
+        # box tumor di atas DETECTION_CONF, jadi hanya dihitung jika memang akan dibuat
+        has_tumor = any(is_tumor_label(d["label"]) and d["confidence"] >= DETECTION_CONF for d in detected_objects)
+        artifacts = ("annotated_image", "mask_image") if has_tumor else ("annotated_image",)
+        if render_artifacts and not render_artifacts(final_label, final_conf, artifacts):
+            return final_label, final_conf, None, None, explanation, 0.0
+
         annotated_img = img_rgb.copy()
         final_mask = np.zeros((h, w), dtype=np.uint8)
-        detected_objects = []
-
-        for i, box in enumerate(boxes):
-            label = names[int(classes[i])]
-            confidence = confs[i]
 
-            detected_objects.append({"label": label, "confidence": confidence})
+        for box, obj in zip(boxes, detected_objects):
+            label = obj["label"]
 
-            if "no_tumor" in label.lower(): continue
+            if not is_tumor_label(label) or obj["confidence"] < DETECTION_CONF: continue
 
             # Draw Bounding Box
             x1, y1, x2, y2 = map(int, box)
@@ -67,16 +126,4 @@ class BrainTumorDetector:
         tumor_px = cv2.countNonZero(final_mask)
         size_pct = (tumor_px / total_px) * 100
 
-        # Classification Logic
-        valid_tumors = [d for d in detected_objects if d['label'] != 'No Tumor']
-        if valid_tumors:
-            valid_tumors.sort(key=lambda x: x['confidence'], reverse=True)
-            final_label = valid_tumors[0]['label']
-            final_conf = valid_tumors[0]['confidence'] * 100
-            explanation = "AI detected a tumor anomaly. Radiological verification recommended."
-        else:
-            final_label = "No Tumor"
-            final_conf = 100.0
-            explanation = "No tumor anomalies detected."
-
         return final_label, final_conf, Image.fromarray(annotated_img), Image.fromarray(final_mask) if tumor_px > 0 else None, explanation, size_pct
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import threading
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -10,6 +11,8 @@ from matplotlib.ticker import AutoMinorLocator
 import io
 import base64
 from PIL import Image
+from utils.precision import optimize_model, autocast, reference_ecg_batch
+from utils.sync import synchronized
 
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -44,6 +47,9 @@ class ECGNet1D(nn.Module):
 class ECGDetector:
     def __init__(self, model_path="Models/heartbeatfor_model.pt"):
         self.model = None
+        self.load_error = None
+        self.lock = threading.RLock()
+        self.amp_dtype = None
         self.classes_map = {
             0: "Normal Sinus Rhythm",
             1: "Supraventricular (S) - Indikasi Tachycardia",
@@ -63,13 +69,20 @@ class ECGDetector:
             state_dict = ckpt['model_state_dict'] if 'model_state_dict' in ckpt else ckpt
             model_dict = self.model.state_dict()
             pretrained_dict = {k: v for k, v in state_dict.items() if k in model_dict and v.size() == model_dict[k].size()}
+            # Checkpoint yang tidak menutup semua layer = sebagian besar bobot acak -> tolak
+            missing = [k for k in model_dict if k not in pretrained_dict]
+            if missing:
+                raise ValueError(f"checkpoint does not match ECGNet1D ({len(missing)} missing/mismatched keys, e.g. {missing[0]})")
             model_dict.update(pretrained_dict)
             self.model.load_state_dict(model_dict)
             self.model.to(DEVICE).eval()
+            # ECGNet1D tidak dipakai GradCAM, jadi aman untuk torch.compile
+            self.model, self.amp_dtype, _ = optimize_model(self.model, reference_ecg_batch(), DEVICE, "ECG", allow_compile=True)
             print("[ECG] Model loaded.")
         except Exception as e:
             print(f"[ECG] Error loading: {e}")
             self.model = None
+            self.load_error = str(e)
 
     def parse_file_to_signal(self, file_bytes, filename=""):
         try:
@@ -195,9 +208,10 @@ class ECGDetector:
                 for spine in ax.spines.values(): spine.set_visible(False)
                 ax.set_ylabel(f"Lead/Row {i+1}", fontsize=8)
 
-            plt.tight_layout(rect=[0, 0.03, 1, 0.95])
+            # Pakai method figure (bukan pyplot global) agar aman dipakai beberapa thread
+            fig.tight_layout(rect=[0, 0.03, 1, 0.95])
             buf = io.BytesIO()
-            plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
+            fig.savefig(buf, format='png', dpi=150, bbox_inches='tight')
             plt.close(fig)
             buf.seek(0)
             return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("utf-8")
@@ -205,6 +219,22 @@ class ECGDetector:
             print(f"[ECG Plotting Error] {e}")
             return "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
 
+    @synchronized
+    def classify_beats(self, beats):
+        """
+        Klasifikasi batch beat (masing-masing 187 sampel, belum dinormalisasi).
+        Dipakai oleh streaming ECG. Mengembalikan list (label, confidence).
+        """
+        if not self.model or len(beats) == 0:
+            return []
+        batch = np.stack([(b - np.min(b)) / (np.max(b) - np.min(b) + 1e-6) for b in beats])
+        input_tensor = torch.tensor(batch, dtype=torch.float32).unsqueeze(1).to(DEVICE)
+        with torch.no_grad(), autocast(DEVICE, self.amp_dtype):
+            probs = F.softmax(self.model(input_tensor).float(), dim=1)
+            conf_scores, preds = torch.max(probs, 1)
+        return [(self.classes_map.get(p, "Unknown"), c * 100) for p, c in zip(preds.tolist(), conf_scores.tolist())]
+
+    @synchronized
     def predict_from_file(self, file_bytes, filename, options):
         if not self.model:
             return "Model Error", 0.0, "Gagal memuat model.", None
@@ -229,9 +259,9 @@ class ECGDetector:
         input_tensor = torch.tensor(signal_processed, dtype=torch.float32).unsqueeze(0).unsqueeze(0).to(DEVICE)
         
         # 4. Prediksi
-        with torch.no_grad():
+        with torch.no_grad(), autocast(DEVICE, self.amp_dtype):
             outputs = self.model(input_tensor)
-            probs = F.softmax(outputs, dim=1)
+            probs = F.softmax(outputs.float(), dim=1)
             conf_score, preds = torch.max(probs, 1)
             
             pred_idx = preds.item()
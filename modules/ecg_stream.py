@@ -0,0 +1,313 @@
+import time
+import uuid
+import threading
+from collections import deque
+import numpy as np
+
+# ============================================================
+# STREAMING ECG (feed monitor bedside)
+# ============================================================
+# Deteksi QRS inkremental ala Pan-Tompkins (diff -> square -> moving window
+# integration) dengan state filter dibawa antar chunk, sehingga tiap chunk
+# hanya memproses sampel baru. Beat yang sudah lengkap (187 sampel di sekitar
+# puncak R) langsung diklasifikasi dengan ECGNet1D.
+# Sinyal masuk di-resample ke MODEL_FS (rate data training ECGNet1D) sebelum
+# deteksi, sehingga 187 sampel selalu mewakili 1.5 detik dan ukuran buffer
+# tidak bergantung pada fs client.
+BEAT_LEN = 187                 # Panjang input ECGNet1D
+MODEL_FS = 125                 # Sampling rate dataset training (Hz)
+MIN_FS = 50                    # Batas sampling rate input yang diterima (Hz)
+MAX_FS = 2000
+BUFFER_SECONDS = 10            # Kapasitas ring buffer per sesi
+LEARNING_SECONDS = 2           # Fase inisialisasi threshold
+REFRACTORY_SECONDS = 0.2       # Jarak minimum antar QRS
+INTEGRATION_SECONDS = 0.12     # Lebar moving window (~ lebar QRS)
+MAX_QRS_SECONDS = 0.5          # Kandidat di atas threshold lebih lama dari ini bukan QRS (reset)
+DEFAULT_RR_SECONDS = 1.0       # Estimasi RR awal sebelum ada beat
+MAX_RR_SECONDS = 2.0           # Batas atas estimasi RR (30 bpm)
+RR_MISSED_FACTOR = 1.66        # Tanpa beat selama 1.66 x RR rata-rata -> search back / re-learn
+MIN_ENERGY = 1e-10             # Energi terintegrasi di bawah ini dianggap sinyal flat (leads-off)
+MAX_SESSIONS = 64
+SESSION_IDLE_TIMEOUT = 300     # Sesi tanpa data lebih lama dari ini dibuang (detik)
+
+class RingBuffer:
+    """Buffer sinyal berukuran tetap dengan indeks sampel absolut."""
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.total = 0  # Jumlah sampel yang pernah masuk
+
+    def extend(self, samples):
+        received = len(samples)
+        samples = samples[-self.capacity:]
+        n = len(samples)
+        start = (self.total + received - n) % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = samples[:first]
+        self.data[:n - first] = samples[first:]
+        self.total += received
+
+    def get(self, abs_start, abs_end):
+        """Ambil sampel [abs_start, abs_end); None jika sudah tertimpa."""
+        if abs_start < self.total - self.capacity or abs_end > self.total:
+            return None
+        idx = np.arange(abs_start, abs_end) % self.capacity
+        return self.data[idx]
+
+class StreamResampler:
+    """
+    Resampling linear inkremental fs_in -> fs_out; posisi fase & sampel terakhir
+    dibawa antar chunk sehingga hasilnya sama dengan resampling sinyal utuh.
+    """
+    def __init__(self, fs_in, fs_out=MODEL_FS):
+        self.step = fs_in / fs_out  # Jarak antar sampel output dalam satuan sampel input
+        self.passthrough = fs_in == fs_out
+        self.next_t = 0.0           # Posisi (indeks input absolut) sampel output berikutnya
+        self.n_in = 0
+        self.last = None
+
+    def process(self, samples):
+        if self.passthrough or len(samples) == 0: return samples
+        if self.last is None:
+            xs, first_idx = samples, self.n_in
+        else:
+            xs, first_idx = np.concatenate(([self.last], samples)), self.n_in - 1
+        self.n_in += len(samples)
+        self.last = samples[-1]
+
+        end = self.n_in - 1  # Indeks input terakhir yang tersedia
+        if self.next_t > end: return samples[:0]
+        times = np.arange(self.next_t, end + 1e-9, self.step)
+        self.next_t = times[-1] + self.step
+        return np.interp(times, np.arange(first_idx, first_idx + len(xs)), xs).astype(np.float32)
+
+class StreamingQRSDetector:
+    """Pan-Tompkins sederhana dengan state yang dibawa antar chunk."""
+    def __init__(self, fs):
+        self.fs = fs
+        self.window = max(1, int(INTEGRATION_SECONDS * fs))
+        self.refractory = int(REFRACTORY_SECONDS * fs)
+        self.learning_len = int(LEARNING_SECONDS * fs)
+        # State filter
+        self.last_sample = None
+        self.sq_tail = np.zeros(self.window - 1, dtype=np.float32)
+        self.n_processed = 0
+        # State threshold adaptif
+        self.learning = []
+        self.spk = 0.0
+        self.npk = 0.0
+        self.in_qrs = False
+        self.cand_start = 0
+        self.cand_idx = 0
+        self.cand_val = 0.0
+        self.last_peak = -self.refractory
+        self.learned_at = 0  # Indeks akhir fase learning terakhir
+        self.rr = deque(maxlen=8)
+        # Puncak tertinggi sejak beat terakhir, untuk search back
+        self.sb_idx = None
+        self.sb_val = 0.0
+        self.max_qrs_len = int(MAX_QRS_SECONDS * fs)
+        # Keterlambatan maksimum pelaporan puncak relatif terhadap sampel terakhir
+        # (search back), dipakai ECGStreamSession untuk membatasi ukuran slice
+        self.max_lag = int(RR_MISSED_FACTOR * MAX_RR_SECONDS * fs) + self.window
+
+    @property
+    def threshold(self):
+        return self.npk + 0.25 * (self.spk - self.npk)
+
+    @property
+    def missed_limit(self):
+        rr_avg = np.mean(self.rr) if self.rr else DEFAULT_RR_SECONDS * self.fs
+        return RR_MISSED_FACTOR * min(rr_avg, MAX_RR_SECONDS * self.fs)
+
+    def _relearn(self):
+        """Threshold tidak cocok dengan sinyal (mis. spike gerakan saat learning): ulangi fase learning."""
+        self.learning = []
+        self.in_qrs = False
+        self.sb_idx, self.sb_val = None, 0.0
+
+    def _confirm(self, idx, val, weight=0.125):
+        if self.last_peak >= self.learned_at:
+            self.rr.append(idx - self.last_peak)
+        self.spk = weight * val + (1 - weight) * self.spk
+        self.last_peak = idx
+        self.sb_idx, self.sb_val = None, 0.0
+        return max(0, idx - self.window // 2)
+
+    def process(self, samples):
+        """Proses sampel baru; mengembalikan list indeks absolut puncak R yang terkonfirmasi."""
+        if len(samples) == 0: return []
+
+        # 1. Diff dengan sampel terakhir chunk sebelumnya
+        prev = samples[0] if self.last_sample is None else self.last_sample
+        diff = np.diff(np.concatenate(([prev], samples)))
+        self.last_sample = samples[-1]
+
+        # 2. Squaring + 3. Moving window integration (trailing window, ekor dibawa antar chunk)
+        sq = np.concatenate((self.sq_tail, diff.astype(np.float32) ** 2))
+        integrated = np.convolve(sq, np.ones(self.window) / self.window, mode='valid')
+        if self.window > 1: self.sq_tail = sq[-(self.window - 1):]
+
+        base = self.n_processed
+        self.n_processed += len(samples)
+
+        # Integrasi trailing -> puncak energi tertinggal ~setengah window dari puncak R
+        # (dikoreksi di _confirm)
+        peaks = []
+        for offset, v in enumerate(integrated):
+            i = base + offset
+            v = float(v)
+            if len(self.learning) < self.learning_len:
+                # Learning baru dimulai saat ada energi (sinyal flat saat leads-off diabaikan)
+                if not self.learning and v <= MIN_ENERGY: continue
+                self.learning.append(v)
+                if len(self.learning) == self.learning_len:
+                    if max(self.learning) <= MIN_ENERGY:
+                        self._relearn()
+                        continue
+                    self.spk = max(self.learning) / 3
+                    self.npk = float(np.mean(self.learning)) / 2
+                    self.learned_at = i
+                continue
+
+            if v > self.threshold and i - self.last_peak > self.refractory:
+                if not self.in_qrs:
+                    self.in_qrs, self.cand_start = True, i
+                    self.cand_idx, self.cand_val = i, v
+                elif v > self.cand_val:
+                    self.cand_idx, self.cand_val = i, v
+                if i - self.cand_start > self.max_qrs_len:
+                    # Energi tinggi berkepanjangan (artefak / threshold terlalu rendah)
+                    self.in_qrs = False
+            elif self.in_qrs and v < 0.5 * self.threshold:
+                # Akhir QRS -> konfirmasi kandidat
+                self.in_qrs = False
+                peaks.append(self._confirm(self.cand_idx, self.cand_val))
+            elif not self.in_qrs:
+                self.npk = 0.002 * v + 0.998 * self.npk
+                if i - self.last_peak > self.refractory and v > self.sb_val:
+                    self.sb_idx, self.sb_val = i, v
+
+            if not self.in_qrs and i - max(self.last_peak, self.learned_at) > self.missed_limit:
+                if self.sb_idx is not None and self.sb_val > 0.5 * self.threshold:
+                    # Search back: ambil puncak tertinggi sejak beat terakhir dengan threshold diturunkan
+                    peaks.append(self._confirm(self.sb_idx, self.sb_val, weight=0.25))
+                else:
+                    self._relearn()
+        return peaks
+
+def validate_fs(fs):
+    """Sampling rate wajib, numerik, dan dalam rentang [MIN_FS, MAX_FS]; ValueError jika tidak."""
+    if fs is None or fs == "":
+        raise ValueError("fs is required")
+    try:
+        fs = float(fs)
+    except (TypeError, ValueError):
+        raise ValueError("fs must be a number")
+    if not (MIN_FS <= fs <= MAX_FS):
+        raise ValueError(f"fs must be between {MIN_FS} and {MAX_FS} Hz")
+    return fs
+
+class ECGStreamSession:
+    def __init__(self, fs):
+        self.id = uuid.uuid4().hex
+        self.fs = validate_fs(fs)
+        self.resampler = StreamResampler(self.fs)
+        self.samples_received = 0
+        # Buffer & detektor bekerja pada MODEL_FS -> memori per sesi tetap
+        self.buffer = RingBuffer(int(BUFFER_SECONDS * MODEL_FS))
+        self.detector = StreamingQRSDetector(MODEL_FS)
+        self.pending = []  # Puncak R yang menunggu sampel setelahnya
+        # Slice maksimum per langkah: beat terlama yang bisa dilaporkan detektor
+        # (search back) + satu beat penuh masih harus ada di buffer
+        self.max_slice = max(1, self.buffer.capacity - BEAT_LEN - self.detector.max_lag)
+        self.beats_classified = 0
+        self.last_seen = time.time()
+        self.lock = threading.Lock()
+
+    def _collect_ready(self, ready, beats):
+        """Pindahkan puncak yang segmennya sudah lengkap dari pending ke ready/beats."""
+        half = BEAT_LEN // 2
+        waiting = []
+        for peak in self.pending:
+            if peak + half + 1 > self.buffer.total:
+                waiting.append(peak)
+                continue
+            segment = self.buffer.get(max(0, peak - half), peak + half + 1)
+            if segment is None:
+                print(f"[ECG Stream] Beat at sample {peak} overwritten before extraction, skipped.")
+                continue
+            if len(segment) < BEAT_LEN:
+                segment = np.pad(segment, (BEAT_LEN - len(segment), 0), 'edge')
+            ready.append(peak)
+            beats.append(segment)
+        self.pending = waiting
+
+    def push(self, samples, classify_fn):
+        """
+        Tambah chunk sampel, deteksi QRS pada sampel baru saja, dan klasifikasi beat
+        yang sudah lengkap. classify_fn(list beat) -> list (label, confidence).
+        """
+        with self.lock:
+            self.last_seen = time.time()
+            self.samples_received += len(samples)
+            samples = self.resampler.process(np.asarray(samples, dtype=np.float32))
+
+            # Chunk besar (mis. backlog saat reconnect) diproses per slice agar beat
+            # diambil sebelum sampelnya tertimpa ring buffer
+            ready, beats = [], []
+            for start in range(0, len(samples), self.max_slice):
+                piece = samples[start:start + self.max_slice]
+                self.buffer.extend(piece)
+                self.pending.extend(self.detector.process(piece))
+                self._collect_ready(ready, beats)
+
+            results = classify_fn(beats) if beats else []
+            self.beats_classified += len(results)
+
+        return {
+            "session_id": self.id,
+            "samples_received": self.samples_received,
+            "beats": [
+                # sample_index dalam sampling rate input client
+                {"sample_index": int(round(p * self.fs / MODEL_FS)), "time_s": round(p / MODEL_FS, 3), "label": label, "confidence": conf}
+                for p, (label, conf) in zip(ready, results)
+            ]
+        }
+
+class ECGStreamManager:
+    """Menyimpan sesi streaming; jumlah sesi & memori per sesi dibatasi."""
+    def __init__(self, get_engine, max_sessions=MAX_SESSIONS):
+        self.get_engine = get_engine
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def _evict_idle(self):
+        now = time.time()
+        for sid in [s for s, sess in self.sessions.items() if now - sess.last_seen > SESSION_IDLE_TIMEOUT]:
+            del self.sessions[sid]
+
+    def create(self, fs):
+        fs = validate_fs(fs)
+        with self.lock:
+            self._evict_idle()
+            if len(self.sessions) >= self.max_sessions:
+                raise RuntimeError("Too many active ECG stream sessions")
+            session = ECGStreamSession(fs)
+            self.sessions[session.id] = session
+            return session
+
+    def get(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def close(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def push(self, session_id, samples):
+        session = self.get(session_id)
+        if session is None: return None
+        # Engine diambil per chunk agar hot-swap model langsung berlaku
+        return session.push(samples, lambda beats: self.get_engine().classify_beats(beats))
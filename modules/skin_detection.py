@@ -1,9 +1,12 @@
 import os
+import threading
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from torchvision import models, transforms
 from utils.gradcam import generate_heatmap
+from utils.precision import optimize_model, autocast, to_model_layout, reference_image_batch
+from utils.sync import synchronized
 
 # Pastikan Device konsisten
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -17,6 +20,10 @@ data_transforms = transforms.Compose([
 class SkinDetector:
     def __init__(self, model_path="Models/skin_model.pth"):
         self.model = None
+        self.load_error = None
+        self.lock = threading.RLock()  # Satu request per detector (hooks GradCAM bersifat global per model)
+        self.amp_dtype = None
+        self.channels_last = False
         self.load_model(model_path)
 
     def load_model(self, path):
@@ -36,35 +43,59 @@ class SkinDetector:
             # PINDAHKAN MODEL KE DEVICE (Penting untuk error Input type mismatch)
             self.model.to(DEVICE)
             self.model.eval()
+            self.model, self.amp_dtype, self.channels_last = optimize_model(self.model, reference_image_batch(), DEVICE, "Skin")
             print(f"[Skin] Model loaded on {DEVICE}.")
         except Exception as e:
             print(f"[Skin] Error: {e}")
+            # Jangan biarkan ResNet yang bobotnya acak terlihat sebagai model yang valid
+            self.model = None
+            self.load_error = str(e)
 
-    def predict(self, img_pil):
+    @synchronized
+    def classify_batch(self, images):
+        """
+        Klasifikasi batch tanpa heatmap (dipakai bulk CLI).
+        Mengembalikan list (label, confidence, {}).
+        """
+        if not self.model:
+            return [("Model Error", 0.0, {})] * len(images)
+
+        batch = torch.stack([data_transforms(img) for img in images]).to(DEVICE)
+        batch = to_model_layout(batch, self.channels_last)
+        with torch.no_grad(), autocast(DEVICE, self.amp_dtype):
+            probs = F.softmax(self.model(batch).float(), dim=1)
+            conf_scores, preds = torch.max(probs, 1)
+
+        return [("Scabies" if p == 1 else "Healthy Skin", c * 100, {}) for p, c in zip(preds.tolist(), conf_scores.tolist())]
+
+    @synchronized
+    def predict(self, img_pil, render_artifacts=None):
+        """
+        render_artifacts(label, confidence, artifacts) -> bool (opsional, mode triage):
+        jika False, heatmap tidak dibuat (dikembalikan None).
+        """
         if not self.model:
             return "Model Error", 0.0, None
 
         # 1. Siapkan Tensor di Device yang benar
-        img_tensor = data_transforms(img_pil).unsqueeze(0).to(DEVICE)
+        img_tensor = to_model_layout(data_transforms(img_pil).unsqueeze(0).to(DEVICE), self.channels_last)
         
-        # 2. PENTING UNTUK GRADCAM: Nyalakan requires_grad
-        # Error "element 0 ... does not require grad" terjadi karena baris ini kurang
-        img_tensor.requires_grad = True
-        
-        # 3. HAPUS 'with torch.no_grad():' 
-        # Kita butuh gradient untuk GradCAM, jadi biarkan gradient mengalir
+        # 2. Forward klasifikasi tanpa autograd; GradCAM (generate_heatmap) membuat
+        # graph sendiri dari clone tensor dengan requires_grad
         try:
-            # Pastikan model di mode eval tapi parameter tetap ada
-            self.model.zero_grad()
-            
-            outputs = self.model(img_tensor)
-            probs = F.softmax(outputs, dim=1)
+            with torch.no_grad(), autocast(DEVICE, self.amp_dtype):
+                outputs = self.model(img_tensor)
+                probs = F.softmax(outputs.float(), dim=1)
             conf_score, preds = torch.max(probs, 1)
             
             label = "Scabies" if preds.item() == 1 else "Healthy Skin"
             confidence = conf_score.item() * 100
             
-            # 4. Generate Heatmap
+            # Early exit triage: hasil negatif yang yakin tidak perlu heatmap
+            if render_artifacts and not render_artifacts(label, confidence, ("gradcam_image",)):
+                return label, confidence, None
+            
+            # 4. Generate Heatmap (fp32, di luar autocast)
             # Pastikan generate_heatmap menangani backward pass
             heatmap_pil = generate_heatmap(img_tensor, self.model, self.model.layer4[-1])
             
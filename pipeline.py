@@ -0,0 +1,386 @@
+import io
+import os
+import time
+import base64
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.orthanc_client import upload_dicom, get_orthanc_preview
+from utils.model_registry import ModelRegistry, DEFAULT_WEIGHTS
+from utils.result_store import ResultStore
+from modules.bone_detection import BoneDetector
+from modules.brain_detection import BrainTumorDetector
+from modules.skin_detection import SkinDetector
+from modules.ecg_detection import ECGDetector
+from modules.ecg_stream import ECGStreamManager
+
+# ===========================================
+# Logika analisis bersama untuk server Flask (app.py) dan ASGI (asgi.py)
+# ===========================================
+
+ORTHANC_VIEWER_URL = "http://localhost:8042/ohif/viewer?StudyInstanceUIDs={}"
+RESULTS_DIR = os.environ.get("MDH_RESULTS_DIR", "Results")
+TRIAGE_THRESHOLD = float(os.environ.get("MDH_TRIAGE_THRESHOLD", 95.0))
+
+# Engine gambar yang bisa digabung dalam satu request fan-out
+IMAGE_TYPES = ("bone", "brain", "skin")
+FANOUT_WORKERS = int(os.environ.get("MDH_FANOUT_WORKERS", len(IMAGE_TYPES)))
+
+# Label negatif per engine untuk mode triage
+TRIAGE_NEGATIVE_LABELS = {"bone": "Healthy", "skin": "Healthy Skin", "brain": "No Tumor"}
+
+# Field hasil yang berisi gambar (PIL) dan perlu di-encode ke base64
+ARTIFACT_FIELDS = ("original_image", "gradcam_image", "enhanced_image", "annotated_image", "mask_image")
+
+class AnalysisError(Exception):
+    """Error yang dikembalikan ke client sebagai {'error': ...} dengan status HTTP tertentu."""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+print("--- Initializing AI Modules ---")
+# Registry: index Models/ (engine + versi + hash), hot-swap & A/B routing
+registry = ModelRegistry("Models")
+registry.register("bone", BoneDetector, DEFAULT_WEIGHTS["bone"])
+registry.register("brain", BrainTumorDetector, DEFAULT_WEIGHTS["brain"])
+registry.register("skin", SkinDetector, DEFAULT_WEIGHTS["skin"])
+registry.register("ecg", ECGDetector, DEFAULT_WEIGHTS["ecg"])
+result_store = ResultStore(RESULTS_DIR)
+# Pool untuk menjalankan beberapa engine paralel (mode fan-out, server Flask)
+fanout_pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+# Sesi streaming ECG; engine diambil dari registry per chunk
+ecg_streams = ECGStreamManager(lambda: registry.route('ecg')[1])
+print("--- Initialization Complete ---")
+
+def img_to_b64(img_obj):
+    try:
+        if img_obj is None: return None
+        if img_obj.mode != 'RGB': img_obj = img_obj.convert('RGB')
+        buf = io.BytesIO()
+        img_obj.save(buf, format="PNG")
+        return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("utf-8")
+    except Exception as e:
+        print(f"Image Convert Error: {e}")
+        return ""
+
+# FUNGSI TAMBAHAN: Enhancement Citra (Pengganti RealESRGAN jika model belum load)
+def enhance_image_cv(pil_img):
+    try:
+        img_np = np.array(pil_img)
+        img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
+
+        # Menggunakan CLAHE (Contrast Limited Adaptive Histogram Equalization)
+        # untuk meningkatkan detail tekstur kulit/tulang
+        lab = cv2.cvtColor(img_cv, cv2.COLOR_BGR2LAB)
+        l, a, b = cv2.split(lab)
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        cl = clahe.apply(l)
+        limg = cv2.merge((cl,a,b))
+        final = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
+        final_rgb = cv2.cvtColor(final, cv2.COLOR_BGR2RGB)
+
+        return Image.fromarray(final_rgb)
+    except Exception as e:
+        print(f"Enhancement Error: {e}")
+        return pil_img
+
+SCABIES_INFO = {
+    "description": "Scabies (kudis) adalah penyakit kulit menular yang disebabkan oleh tungau Sarcoptes scabiei.",
+    "treatment": "1. Krim Permethrin 5%.<br>2. Cuci pakaian dengan air panas.<br>3. Hindari kontak langsung."
+}
+
+# ===========================================
+# Parsing request
+# ===========================================
+def ecg_options(form):
+    return {
+        'rows': form.get('ecg_rows', 1),
+        'grid': form.get('ecg_grid', 'true'),
+        'details': form.get('ecg_details', 'false')
+    }
+
+def analysis_options(form):
+    try:
+        triage_threshold = float(form.get('triage_threshold', TRIAGE_THRESHOLD))
+    except ValueError:
+        raise AnalysisError('triage_threshold must be a number', 400)
+    return {
+        'bone_tiled': form.get('bone_tiled', 'false') == 'true',
+        'triage': form.get('triage', 'false') == 'true',
+        'triage_threshold': triage_threshold
+    }
+
+def parse_types(form):
+    """
+    Field 'types' untuk mode fan-out (dipisah koma atau diulang, mis. types=bone,skin).
+    Mengembalikan None jika tidak ada (mode satu engine biasa).
+    """
+    raw = form.getlist('types')
+    if not raw: return None
+    types = list(dict.fromkeys(t.strip() for item in raw for t in item.split(',') if t.strip()))
+    invalid = [t for t in types if t not in IMAGE_TYPES]
+    if not types or invalid:
+        raise AnalysisError(f"types must be a subset of {', '.join(IMAGE_TYPES)}", 400)
+    return types
+
+# ===========================================
+# Decode upload
+# ===========================================
+def is_dicom(filename):
+    return filename.lower().endswith('.dcm')
+
+def decode_image_bytes(file_bytes):
+    try:
+        return Image.open(io.BytesIO(file_bytes)).convert("RGB")
+    except Exception as img_err:
+        raise AnalysisError(f"File bukan gambar valid: {str(img_err)}", 400)
+
+def load_image(file_bytes, filename, batch_id=None):
+    """Decode upload -> (image_pil, viewer_url, study_uid). File DICOM diproses lewat Orthanc."""
+    if is_dicom(filename):
+        orthanc_res = upload_dicom(file_bytes, batch_id)
+        if not orthanc_res:
+            raise AnalysisError('Orthanc Upload Failed', 500)
+        instance_id, study_uid, frames = orthanc_res
+        return get_orthanc_preview(instance_id), ORTHANC_VIEWER_URL.format(study_uid), study_uid
+    return decode_image_bytes(file_bytes), None, None
+
+# ===========================================
+# Fan-out (satu upload, beberapa engine)
+# ===========================================
+def run_fanout(types, image_pil, options):
+    """Jalankan beberapa engine secara paralel pada gambar yang sudah di-decode sekali."""
+    futures = {t: fanout_pool.submit(run_analysis, t, image_pil, options) for t in types}
+    return {t: f.result() for t, f in futures.items()}
+
+def fanout_response(base, per_type, file_bytes, batch_id=None):
+    """
+    Gabungkan hasil fan-out: gambar asli di-encode sekali, artefak per engine
+    di-encode terpisah, dan tiap engine disimpan sebagai record sendiri.
+    """
+    base = encode_artifacts(dict(base))
+    results = {}
+    for t, res in per_type.items():
+        encode_artifacts(res)
+        stored = store_result({**base, **res, "type": t}, file_bytes, batch_id)
+        res["result_id"] = stored.get("result_id")
+        results[t] = res
+    return {**base, "type": "multi", "types": list(per_type), "results": results}
+
+# ===========================================
+# Triage (early exit)
+# ===========================================
+class TriageGate:
+    """
+    Callback render_artifacts untuk detector: artefak berat hanya dibuat jika hasil
+    positif atau confidence di bawah threshold. Detector mengirim daftar artefak yang
+    akan dibuat, sehingga skipped_artifacts berisi pekerjaan yang benar-benar dilewati.
+    """
+    def __init__(self, analysis_type, threshold):
+        self.negative_label = TRIAGE_NEGATIVE_LABELS.get(analysis_type)
+        self.threshold = threshold
+        self.skipped = False
+        self.skipped_artifacts = []
+
+    def __call__(self, label, confidence, artifacts=()):
+        self.skipped = label == self.negative_label and confidence >= self.threshold
+        self.skipped_artifacts = list(artifacts) if self.skipped else []
+        return not self.skipped
+
+class TriageStats:
+    """Counter jumlah request triage dan artefak yang dilewati per engine."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.skipped = Counter()
+        self.artifacts = Counter()
+
+    def record(self, analysis_type, gate):
+        with self.lock:
+            self.requests[analysis_type] += 1
+            if gate.skipped: self.skipped[analysis_type] += 1
+            self.artifacts[analysis_type] += len(gate.skipped_artifacts)
+
+    def summary(self):
+        with self.lock:
+            return {
+                t: {
+                    "requests": n,
+                    "early_exits": self.skipped[t],
+                    "artifacts_skipped": self.artifacts[t],
+                    "skip_rate": round(self.skipped[t] / n, 4)
+                }
+                for t, n in self.requests.items()
+            }
+
+triage_stats = TriageStats()
+
+# ===========================================
+# Inference
+# ===========================================
+def analyze_ecg(file_bytes, filename, options):
+    version, ecg_engine = registry.route('ecg')
+    started = time.perf_counter()
+    label, conf, explanation, plot_image = ecg_engine.predict_from_file(file_bytes, filename, options)
+    registry.record('ecg', version, started, label)
+    return {
+        "type": "ecg", "filename": filename, "label": label, "confidence": conf,
+        "explanation": explanation, "original_image": plot_image, "model_version": version
+    }
+
+def base_result(analysis_type, filename, image_pil, viewer_url, study_uid):
+    return {
+        "type": analysis_type,
+        "filename": filename,
+        "original_image": image_pil,
+        "viewer_url": viewer_url,
+        "study_uid": study_uid
+    }
+
+def run_analysis(analysis_type, image_pil, options):
+    """
+    Inference satu engine gambar (bone/brain/skin). Artefak dikembalikan sebagai
+    PIL Image; encode dengan encode_artifacts() sebelum dikirim ke client.
+    """
+    result = {}
+    if analysis_type not in registry.slots: return result
+
+    version, engine = registry.route(analysis_type)
+    result["model_version"] = version
+    started = time.perf_counter()
+    # Mode triage tidak berlaku untuk bone tiled (heatmap dihitung bersama logits tile)
+    gate = TriageGate(analysis_type, options['triage_threshold']) if options.get('triage') and not options.get('bone_tiled') else None
+
+    if analysis_type == 'brain':
+        label, conf, annotated, mask, expl, size = engine.predict(image_pil, render_artifacts=gate)
+        result.update({ "label": label, "confidence": conf, "explanation": expl, "tumor_size": f"{size:.2f}%", "annotated_image": annotated, "mask_image": mask })
+
+    elif analysis_type == 'bone':
+        # Bone engine sudah mengembalikan enhanced image, tapi kita pastikan ada
+        if options.get('bone_tiled'):
+            # Mode tiled untuk radiograf resolusi tinggi
+            label, conf, heatmap, all_preds, enhanced, tile_info = engine.predict_tiled(image_pil)
+            result["tiling"] = tile_info
+        else:
+            label, conf, heatmap, all_preds, enhanced = engine.predict(image_pil, render_artifacts=gate)
+        if enhanced is None and not (gate and gate.skipped): enhanced = enhance_image_cv(image_pil) # Fallback
+        result.update({ "label": label, "confidence": conf, "all_predictions": all_preds, "gradcam_image": heatmap, "enhanced_image": enhanced })
+
+    elif analysis_type == 'skin':
+        label, conf, heatmap = engine.predict(image_pil, render_artifacts=gate)
+
+        # [FIX] Generate Enhanced Image secara manual di sini untuk fitur Scabies
+        if gate and gate.skipped:
+            enhanced_pil = None
+            gate.skipped_artifacts.append("enhanced_image")
+        else:
+            enhanced_pil = enhance_image_cv(image_pil)
+
+        skin_result = {
+            "label": label,
+            "confidence": conf,
+            "gradcam_image": heatmap,
+            "enhanced_image": enhanced_pil # Kirim data enhanced
+        }
+        if "scabies" in label.lower(): skin_result.update(SCABIES_INFO)
+        result.update(skin_result)
+
+    if gate:
+        triage_stats.record(analysis_type, gate)
+        result["triage"] = {"artifacts_skipped": gate.skipped, "skipped": gate.skipped_artifacts, "threshold": gate.threshold}
+
+    registry.record(analysis_type, version, started, result.get("label"))
+    return result
+
+def encode_artifacts(result):
+    """Encode semua artefak PIL di dalam result menjadi data URL base64 (in-place)."""
+    for key in ARTIFACT_FIELDS:
+        if isinstance(result.get(key), Image.Image):
+            result[key] = img_to_b64(result[key])
+    return result
+
+# ===========================================
+# Streaming ECG
+# ===========================================
+def parse_stream_chunk(payload):
+    """Chunk streaming berupa JSON {"samples": [...]}."""
+    samples = payload.get('samples') if isinstance(payload, dict) else None
+    if samples is None: raise AnalysisError('samples is required', 400)
+    try:
+        return np.asarray(samples, dtype=np.float32).ravel()
+    except (TypeError, ValueError) as e:
+        raise AnalysisError(f"Invalid samples: {e}", 400)
+
+def create_ecg_stream(params):
+    try:
+        session = ecg_streams.create(fs=params.get('fs'))
+    except ValueError as e:
+        raise AnalysisError(str(e), 400)
+    except RuntimeError as e:
+        raise AnalysisError(str(e), 503)
+    return {"session_id": session.id, "fs": session.fs}
+
+def push_ecg_stream(session_id, payload):
+    res = ecg_streams.push(session_id, parse_stream_chunk(payload))
+    if res is None: raise AnalysisError('Unknown stream session', 404)
+    return res
+
+# ===========================================
+# Result store
+# ===========================================
+RESULT_FILTERS = ("batch_id", "study_uid", "analysis_type", "label", "file_hash",
+                  "min_confidence", "max_confidence", "date_from", "date_to", "page", "page_size")
+
+def store_result(result, file_bytes, batch_id=None):
+    """Simpan hasil (artefak sudah di-encode) ke result store; kegagalan tidak menggagalkan request."""
+    try:
+        result["result_id"] = result_store.save(result, file_bytes, batch_id)
+    except Exception as e:
+        print(f"[Store] Error saving result: {e}")
+    return result
+
+def query_results(args):
+    """Query result store dari parameter URL (lihat RESULT_FILTERS)."""
+    filters = {key: args.get(key) for key in RESULT_FILTERS if args.get(key) not in (None, "")}
+    return result_store.query(include_artifacts=args.get('artifacts', 'false') == 'true', **filters)
+
+# ===========================================
+# Model registry actions
+# ===========================================
+def model_action(engine_name, action, params=None):
+    """Menjalankan aksi registry; mengembalikan (payload, status HTTP)."""
+    if engine_name not in registry.slots:
+        return {'error': f"Unknown engine '{engine_name}'"}, 404
+    slot = registry.slots[engine_name]
+    params = params or {}
+
+    if action == 'load':
+        version = params.get('version')
+        if not version: return {'error': 'version is required'}, 400
+        candidate_pct = params.get('candidate_pct')
+        if candidate_pct in (None, ""):
+            candidate_pct = None
+        else:
+            try:
+                candidate_pct = float(candidate_pct)
+            except (TypeError, ValueError):
+                return {'error': 'candidate_pct must be a number'}, 400
+            # NaN juga ditolak karena semua perbandingan bernilai False
+            if not 0 <= candidate_pct <= 100:
+                return {'error': 'candidate_pct must be between 0 and 100'}, 400
+        registry.scan()
+        if registry.find(engine_name, version) is None: return {'error': f"Version '{version}' not found"}, 404
+        started = slot.load_async(version, candidate_pct)
+        return {'engine': engine_name, 'version': version, 'status': 'loading' if started else 'already loading'}, 202
+    if action == 'promote':
+        if not slot.promote(): return {'error': 'No candidate loaded'}, 409
+        return slot.describe(), 200
+    if action == 'rollback':
+        slot.rollback()
+        return slot.describe(), 200
+    return {'error': f"Unknown action '{action}'"}, 404
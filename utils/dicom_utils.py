@@ -0,0 +1,43 @@
+import io
+import os
+import numpy as np
+import pydicom
+from PIL import Image
+
+try:
+    from pydicom.pixels import apply_voi_lut
+except ImportError:  # pydicom < 3
+    from pydicom.pixel_data_handlers.util import apply_voi_lut
+
+def dicom_to_pil(file_bytes):
+    """
+    Render DICOM ke PIL RGB secara lokal (tanpa Orthanc), setara dengan preview
+    Orthanc: frame pertama, VOI LUT/windowing, MONOCHROME1 dibalik, skala 8-bit.
+    """
+    ds = pydicom.dcmread(io.BytesIO(file_bytes), force=True)
+    pixels = ds.pixel_array
+    if int(getattr(ds, "NumberOfFrames", 1) or 1) > 1:
+        pixels = pixels[0]
+
+    if getattr(ds, "PhotometricInterpretation", "") in ("RGB", "YBR_FULL", "YBR_FULL_422"):
+        return Image.fromarray(pixels.astype(np.uint8)).convert("RGB")
+
+    pixels = apply_voi_lut(pixels, ds).astype(np.float32)
+    pixels -= pixels.min()
+    pixels /= (pixels.max() + 1e-6)
+    if getattr(ds, "PhotometricInterpretation", "") == "MONOCHROME1":
+        pixels = 1.0 - pixels
+    return Image.fromarray((pixels * 255).astype(np.uint8)).convert("RGB")
+
+def read_dicomdir(path):
+    """Daftar path file gambar yang direferensikan oleh sebuah DICOMDIR."""
+    ds = pydicom.dcmread(path)
+    root = os.path.dirname(os.path.abspath(path))
+    files = []
+    for record in ds.DirectoryRecordSequence:
+        if record.DirectoryRecordType != "IMAGE" or "ReferencedFileID" not in record:
+            continue
+        file_id = record.ReferencedFileID
+        parts = [file_id] if isinstance(file_id, str) else list(file_id)
+        files.append(os.path.join(root, *parts))
+    return files
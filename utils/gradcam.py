@@ -15,9 +15,16 @@ class GradCAM:
         self.gradients = None
         self.activations = None
 
-        # Register Hooks
-        self.target_layer.register_forward_hook(self.save_activation)
-        self.target_layer.register_full_backward_hook(self.save_gradient)
+        # Register Hooks (dilepas lewat remove_hooks agar tidak menumpuk di layer)
+        self.handles = [
+            self.target_layer.register_forward_hook(self.save_activation),
+            self.target_layer.register_full_backward_hook(self.save_gradient)
+        ]
+
+    def remove_hooks(self):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
 
     def save_activation(self, module, input, output):
         self.activations = output
@@ -65,7 +72,46 @@ class GradCAM:
             
             # ERROR FIX 2: "Can't call numpy() on Tensor that requires grad"
             # Kita harus detach() dulu sebelum convert ke numpy
-            return cam.detach().cpu().numpy()[0, 0]
+            return cam.detach().float().cpu().numpy()[0, 0]
+
+# ===========================================
+# Batch GradCAM (untuk inferensi tiled)
+# ===========================================
+def generate_cam_batch(input_batch, model, target_layer, class_selector=None):
+    """
+    GradCAM untuk satu batch sekaligus: satu forward + satu backward.
+    class_selector(logits) -> index kelas target per sampel (default: argmax).
+    Mengembalikan (logits [B, C], cams numpy [B, h, w] ternormalisasi 0-1).
+    """
+    store = {}
+    h_fwd = target_layer.register_forward_hook(lambda m, i, o: store.__setitem__('act', o))
+    h_bwd = target_layer.register_full_backward_hook(lambda m, gi, go: store.__setitem__('grad', go[0]))
+    try:
+        input_model = input_batch.detach().clone()
+        input_model.requires_grad = True
+
+        with torch.enable_grad():
+            model.zero_grad()
+            output = model(input_model)
+            class_idx = class_selector(output) if class_selector else output.argmax(dim=1)
+
+            # Model dalam mode eval -> sampel dalam batch independen,
+            # jadi backward dari jumlah skor = gradient masing-masing sampel
+            output.gather(1, class_idx.view(-1, 1)).sum().backward()
+
+            weights = torch.mean(store['grad'], dim=[2, 3], keepdim=True)
+            cam = F.relu(torch.sum(weights * store['act'], dim=1))
+
+            # Normalize min-max per sampel
+            flat = cam.view(cam.size(0), -1)
+            cam_min = flat.min(dim=1)[0].view(-1, 1, 1)
+            cam_max = flat.max(dim=1)[0].view(-1, 1, 1)
+            cam = (cam - cam_min) / (cam_max - cam_min + 1e-7)
+
+        return output.detach(), cam.detach().float().cpu().numpy()
+    finally:
+        h_fwd.remove()
+        h_bwd.remove()
 
 # ===========================================
 # Helper: Tensor to Image (Denormalization)
@@ -123,7 +169,10 @@ def generate_heatmap(input_tensor, model, target_layer):
         
         # 2. Generate Raw CAM (Mask)
         # Note: input_tensor tidak perlu diubah device-nya di sini, biarkan apa adanya
-        cam_mask = grad_cam(input_tensor)
+        try:
+            cam_mask = grad_cam(input_tensor)
+        finally:
+            grad_cam.remove_hooks()
         
         # 3. Dapatkan Gambar Asli dari Tensor untuk Overlay
         original_img_np = tensor_to_image(input_tensor)
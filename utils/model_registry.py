@@ -0,0 +1,216 @@
+import os
+import time
+import random
+import hashlib
+import threading
+from collections import Counter, deque
+
+# ===========================================
+# Konvensi folder Models/
+# ===========================================
+# - Weight bawaan (mis. Models/bone_best.pth) terdaftar sebagai versi "default".
+# - Versi tambahan diletakkan di subfolder per engine: Models/<engine>/<versi>.<ext>
+#   contoh: Models/bone/v2.pth -> engine "bone", versi "v2".
+WEIGHT_EXTENSIONS = ('.pth', '.pt')
+DEFAULT_WEIGHTS = {
+    "bone": "bone_best.pth",
+    "brain": "brain-model-2.pt",
+    "skin": "skin_model.pth",
+    "ecg": "heartbeatfor_model.pt",
+}
+DEFAULT_VERSION = "default"
+LATENCY_WINDOW = 500  # Jumlah sampel latency terakhir yang disimpan per versi
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class VersionStats:
+    """Statistik per versi: latency & distribusi label prediksi."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.labels = Counter()
+
+    def record(self, latency_s, label):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(latency_s)
+            self.labels[label] += 1
+
+    def summary(self):
+        with self.lock:
+            lat = sorted(self.latencies)
+            labels = dict(self.labels)
+            requests = self.requests
+        pct = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 1) if lat else None
+        return {
+            "requests": requests,
+            "latency_ms_p50": pct(0.5),
+            "latency_ms_p95": pct(0.95),
+            "labels": labels
+        }
+
+class EngineSlot:
+    """
+    Satu slot engine (bone/brain/skin/ecg) yang menyimpan detector live dan
+    (opsional) kandidat untuk A/B routing. Swap dilakukan dengan mengganti
+    referensi secara atomik, sehingga request yang sedang berjalan tetap
+    memakai detector lama sampai selesai.
+    """
+    def __init__(self, name, factory, registry):
+        self.name = name
+        self.factory = factory
+        self.registry = registry
+        self.live = None        # (version, detector)
+        self.candidate = None   # (version, detector)
+        self.candidate_pct = 0.0
+        self.loading = {}       # version -> status
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def _stats_for(self, version):
+        with self.lock:
+            return self.stats.setdefault(version, VersionStats())
+
+    def _build(self, version):
+        entry = self.registry.find(self.name, version)
+        if entry is None:
+            raise ValueError(f"Version '{version}' not found for engine '{self.name}'")
+        detector = self.factory(model_path=entry["path"])
+        if getattr(detector, "model", None) is None:
+            # Detector menangkap error load-nya sendiri; teruskan alasannya ke status loading
+            reason = getattr(detector, "load_error", None)
+            raise RuntimeError(f"Failed to load weights from {entry['path']}" + (f": {reason}" if reason else ""))
+        return detector
+
+    def load(self, version=DEFAULT_VERSION):
+        """Load sinkron (dipakai saat startup)."""
+        detector = self.factory(model_path=self.registry.default_paths[self.name]) if version == DEFAULT_VERSION else self._build(version)
+        self.live = (version, detector)
+        return detector
+
+    def load_async(self, version, candidate_pct=None):
+        """
+        Load versi baru di background. Jika candidate_pct diberikan, versi dipasang
+        sebagai kandidat A/B; jika tidak, langsung menggantikan versi live.
+        """
+        with self.lock:
+            if self.loading.get(version) == "loading":
+                return False
+            self.loading[version] = "loading"
+
+        def worker():
+            try:
+                detector = self._build(version)
+                with self.lock:
+                    if candidate_pct is None:
+                        self.live = (version, detector)
+                    else:
+                        self.candidate = (version, detector)
+                        self.candidate_pct = float(candidate_pct)
+                    self.loading[version] = "ready"
+                print(f"[Registry] {self.name}:{version} loaded ({'candidate' if candidate_pct is not None else 'live'}).")
+            except Exception as e:
+                with self.lock:
+                    self.loading[version] = f"error: {e}"
+                print(f"[Registry] Error loading {self.name}:{version}: {e}")
+
+        threading.Thread(target=worker, name=f"load-{self.name}-{version}", daemon=True).start()
+        return True
+
+    def promote(self):
+        with self.lock:
+            if not self.candidate: return False
+            self.live, self.candidate, self.candidate_pct = self.candidate, None, 0.0
+            return True
+
+    def rollback(self):
+        with self.lock:
+            self.candidate, self.candidate_pct = None, 0.0
+            return True
+
+    def route(self):
+        """Pilih (version, detector) untuk satu request berdasarkan persentase kandidat."""
+        live, candidate, pct = self.live, self.candidate, self.candidate_pct
+        if candidate and random.random() * 100 < pct:
+            return candidate
+        return live
+
+    def record(self, version, latency_s, label):
+        self._stats_for(version).record(latency_s, label)
+
+    def describe(self):
+        with self.lock:
+            stats = dict(self.stats)
+            loading = dict(self.loading)
+        return {
+            "live": self.live[0] if self.live else None,
+            "candidate": self.candidate[0] if self.candidate else None,
+            "candidate_pct": self.candidate_pct,
+            "loading": loading,
+            "stats": {v: s.summary() for v, s in stats.items()}
+        }
+
+class ModelRegistry:
+    """Index folder Models/ berdasarkan engine + versi + hash, dan pengelola EngineSlot."""
+    def __init__(self, models_dir="Models"):
+        self.models_dir = models_dir
+        self.default_paths = {}
+        self.slots = {}
+        self.index = {}
+        self._hash_cache = {}  # (path, mtime, size) -> sha256
+
+    def register(self, name, factory, default_file, load=True):
+        self.default_paths[name] = os.path.join(self.models_dir, default_file)
+        slot = EngineSlot(name, factory, self)
+        self.slots[name] = slot
+        self.scan()
+        if load: slot.load(DEFAULT_VERSION)
+        return slot
+
+    def _entry(self, name, version, path):
+        st = os.stat(path)
+        key = (path, st.st_mtime, st.st_size)
+        if key not in self._hash_cache:
+            self._hash_cache[key] = file_sha256(path)
+        return {"engine": name, "version": version, "path": path,
+                "sha256": self._hash_cache[key][:16], "size": st.st_size, "mtime": st.st_mtime}
+
+    def scan(self):
+        index = {}
+        for name, default_path in self.default_paths.items():
+            entries = []
+            if os.path.exists(default_path):
+                entries.append(self._entry(name, DEFAULT_VERSION, default_path))
+            version_dir = os.path.join(self.models_dir, name)
+            if os.path.isdir(version_dir):
+                for fname in sorted(os.listdir(version_dir)):
+                    stem, ext = os.path.splitext(fname)
+                    if ext in WEIGHT_EXTENSIONS:
+                        entries.append(self._entry(name, stem, os.path.join(version_dir, fname)))
+            index[name] = entries
+        self.index = index
+        return index
+
+    def find(self, name, version):
+        for entry in self.index.get(name, []):
+            if entry["version"] == version:
+                return entry
+        return None
+
+    def route(self, name):
+        return self.slots[name].route()
+
+    def record(self, name, version, started, label):
+        self.slots[name].record(version, time.perf_counter() - started, label)
+
+    def describe(self):
+        return {
+            name: {"versions": self.index.get(name, []), **slot.describe()}
+            for name, slot in self.slots.items()
+        }
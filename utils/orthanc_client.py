@@ -23,15 +23,7 @@ def upload_dicom(file_bytes, batch_id=None):
     Returns (instance_id, study_uid, num_frames) or None.
     """
     try:
-        ds = pydicom.dcmread(io.BytesIO(file_bytes), force=True)
-        
-        # If batch_id provided, force them into the same Study
-        if batch_id:
-            ds.StudyInstanceUID = generate_study_uid_from_batch(batch_id)
-            
-        with io.BytesIO() as out:
-            ds.save_as(out)
-            modified_bytes = out.getvalue()
+        modified_bytes = prepare_dicom(file_bytes, batch_id)
 
         resp = requests.post(f"{ORTHANC_URL}/instances", data=modified_bytes, auth=ORTHANC_AUTH)
         if resp.status_code != 200: 
@@ -42,20 +34,37 @@ def upload_dicom(file_bytes, batch_id=None):
         
         # Get Study UID for Viewer Link
         tags = requests.get(f"{ORTHANC_URL}/instances/{instance_id}/tags", auth=ORTHANC_AUTH).json()
-        study_uid = tags.get('0020,000d', {}).get('Value')
-        
-        # Check frames (for multi-frame DICOMs)
-        frames = 1
-        try:
-             val = tags.get('0028,0008', {}).get('Value')
-             if val: frames = int(val)
-        except: pass
+        study_uid, frames = parse_instance_tags(tags)
 
         return instance_id, study_uid, frames
     except Exception as e:
         logging.error(f"Orthanc Client Error: {e}")
         return None
 
+def prepare_dicom(file_bytes, batch_id=None):
+    """Re-serializes the DICOM, forcing a shared StudyInstanceUID when batch_id is given."""
+    ds = pydicom.dcmread(io.BytesIO(file_bytes), force=True)
+    
+    # If batch_id provided, force them into the same Study
+    if batch_id:
+        ds.StudyInstanceUID = generate_study_uid_from_batch(batch_id)
+        
+    with io.BytesIO() as out:
+        ds.save_as(out)
+        return out.getvalue()
+
+def parse_instance_tags(tags):
+    """Returns (study_uid, num_frames) from an Orthanc /tags response."""
+    study_uid = tags.get('0020,000d', {}).get('Value')
+    
+    # Check frames (for multi-frame DICOMs)
+    frames = 1
+    try:
+         val = tags.get('0028,0008', {}).get('Value')
+         if val: frames = int(val)
+    except: pass
+    return study_uid, frames
+
 def get_orthanc_preview(instance_id, frame=0):
     """
     Fetches a rendered preview image (JPG/PNG) from Orthanc.
@@ -67,4 +76,39 @@ def get_orthanc_preview(instance_id, frame=0):
             return Image.open(io.BytesIO(resp.content)).convert("RGB")
     except Exception as e:
         logging.error(f"Preview Fetch Error: {e}")
-    return None
\ No newline at end of file
+    return None
+
+# ===========================================
+# Async variants (used by the ASGI server)
+# ===========================================
+# `client` is an httpx.AsyncClient created by the server, so this module
+# does not depend on httpx when running the Flask app.
+async def upload_dicom_async(client, modified_bytes):
+    """
+    Async upload of already-prepared DICOM bytes (see prepare_dicom).
+    Returns (instance_id, study_uid, num_frames) or None.
+    """
+    try:
+        resp = await client.post(f"{ORTHANC_URL}/instances", content=modified_bytes, auth=ORTHANC_AUTH)
+        if resp.status_code != 200:
+            logging.error(f"Orthanc Upload Failed: {resp.text}")
+            return None
+
+        instance_id = resp.json()['ID']
+        tags_resp = await client.get(f"{ORTHANC_URL}/instances/{instance_id}/tags", auth=ORTHANC_AUTH)
+        study_uid, frames = parse_instance_tags(tags_resp.json())
+        return instance_id, study_uid, frames
+    except Exception as e:
+        logging.error(f"Orthanc Client Error: {e}")
+        return None
+
+async def get_orthanc_preview_bytes_async(client, instance_id, frame=0):
+    """Fetches the raw preview bytes; decoding is left to the caller's executor."""
+    try:
+        url = f"{ORTHANC_URL}/instances/{instance_id}/frames/{frame}/preview" if frame > 0 else f"{ORTHANC_URL}/instances/{instance_id}/preview"
+        resp = await client.get(url, auth=ORTHANC_AUTH)
+        if resp.status_code == 200:
+            return resp.content
+    except Exception as e:
+        logging.error(f"Preview Fetch Error: {e}")
+    return None
@@ -0,0 +1,152 @@
+import os
+import json
+import base64
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+
+# ===========================================
+# Persistent Result Store
+# ===========================================
+# - Index SQLite (results.db) untuk query cepat by batch / study / tanggal / label / confidence.
+# - Artefak gambar disimpan content-addressed: artifacts/<2 char>/<sha256>.png,
+#   sehingga gambar identik (mis. upload ulang file yang sama) hanya disimpan sekali.
+DATA_URL_PREFIX = "data:image/png;base64,"
+MAX_PAGE_SIZE = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    filename TEXT,
+    analysis_type TEXT NOT NULL,
+    batch_id TEXT,
+    study_uid TEXT,
+    model_version TEXT,
+    label TEXT,
+    confidence REAL,
+    payload TEXT NOT NULL,
+    artifacts TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_batch ON results(batch_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_results_study ON results(study_uid, created_at);
+CREATE INDEX IF NOT EXISTS idx_results_created ON results(created_at);
+CREATE INDEX IF NOT EXISTS idx_results_label ON results(label, confidence);
+CREATE INDEX IF NOT EXISTS idx_results_hash ON results(file_hash, analysis_type, model_version);
+"""
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+class ResultStore:
+    def __init__(self, root="Results"):
+        self.root = root
+        self.artifact_dir = os.path.join(root, "artifacts")
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, "results.db"), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    # --- Artefak (content-addressed) ---
+    def _artifact_path(self, digest):
+        return os.path.join(self.artifact_dir, digest[:2], f"{digest}.png")
+
+    def put_artifact(self, data_url):
+        """Simpan data URL PNG sebagai file; mengembalikan hash konten."""
+        raw = base64.b64decode(data_url[len(DATA_URL_PREFIX):])
+        digest = sha256_bytes(raw)
+        path = self._artifact_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f: f.write(raw)
+            os.replace(tmp, path)
+        return digest
+
+    def get_artifact(self, digest):
+        path = self._artifact_path(digest)
+        if not os.path.exists(path): return None
+        with open(path, 'rb') as f:
+            return DATA_URL_PREFIX + base64.b64encode(f.read()).decode("utf-8")
+
+    # --- Simpan hasil ---
+    def save(self, result, file_bytes, batch_id=None):
+        """Simpan satu hasil analisis (artefak sudah di-encode base64). Mengembalikan id record."""
+        payload, artifacts = {}, {}
+        for key, value in result.items():
+            if isinstance(value, str) and value.startswith(DATA_URL_PREFIX):
+                artifacts[key] = self.put_artifact(value)
+            else:
+                payload[key] = value
+
+        row = (
+            datetime.now().isoformat(timespec="seconds"), sha256_bytes(file_bytes), result.get("filename"),
+            result.get("type"), batch_id, result.get("study_uid"), result.get("model_version"),
+            result.get("label"), result.get("confidence"), json.dumps(payload), json.dumps(artifacts)
+        )
+        with self.lock:
+            cur = self.conn.execute(
+                "INSERT INTO results (created_at, file_hash, filename, analysis_type, batch_id, study_uid, "
+                "model_version, label, confidence, payload, artifacts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            self.conn.commit()
+            return cur.lastrowid
+
+    # --- Query ---
+    def _row_to_dict(self, row, include_artifacts):
+        item = json.loads(row["payload"])
+        item.update({
+            "result_id": row["id"], "created_at": row["created_at"], "file_hash": row["file_hash"],
+            "batch_id": row["batch_id"]
+        })
+        artifacts = json.loads(row["artifacts"])
+        if include_artifacts:
+            for key, digest in artifacts.items():
+                item[key] = self.get_artifact(digest)
+        else:
+            item["artifacts"] = artifacts
+        return item
+
+    def get(self, result_id, include_artifacts=True):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM results WHERE id = ?", (result_id,)).fetchone()
+        return self._row_to_dict(row, include_artifacts) if row else None
+
+    def query(self, batch_id=None, study_uid=None, analysis_type=None, label=None, file_hash=None,
+              min_confidence=None, max_confidence=None, date_from=None, date_to=None,
+              page=1, page_size=50, include_artifacts=False):
+        """
+        Query terindeks dengan pagination. date_from/date_to berupa ISO date/datetime
+        (YYYY-MM-DD inklusif). Mengembalikan {items, total, page, page_size}.
+        """
+        clauses, params = [], []
+        for column, value in (("batch_id", batch_id), ("study_uid", study_uid), ("analysis_type", analysis_type),
+                              ("label", label), ("file_hash", file_hash)):
+            if value is not None:
+                clauses.append(f"{column} = ?"); params.append(value)
+        if min_confidence is not None:
+            clauses.append("confidence >= ?"); params.append(float(min_confidence))
+        if max_confidence is not None:
+            clauses.append("confidence <= ?"); params.append(float(max_confidence))
+        if date_from:
+            clauses.append("created_at >= ?"); params.append(date_from)
+        if date_to:
+            clauses.append("created_at <= ?"); params.append(date_to + "T23:59:59" if len(date_to) == 10 else date_to)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        page = max(1, int(page))
+        page_size = min(MAX_PAGE_SIZE, max(1, int(page_size)))
+
+        with self.lock:
+            total = self.conn.execute(f"SELECT COUNT(*) FROM results {where}", params).fetchone()[0]
+            rows = self.conn.execute(
+                f"SELECT * FROM results {where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [page_size, (page - 1) * page_size]).fetchall()
+
+        return {
+            "items": [self._row_to_dict(r, include_artifacts) for r in rows],
+            "total": total, "page": page, "page_size": page_size
+        }
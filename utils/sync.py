@@ -0,0 +1,12 @@
+import functools
+
+def synchronized(method):
+    """
+    Serialisasi pemanggilan method pada satu instance detector (memakai self.lock).
+    GradCAM hooks, state model & pyplot tidak aman dipakai beberapa thread sekaligus.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper